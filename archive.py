@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta
+from pymongo import ReplaceOne, ASCENDING, DESCENDING
+
+ARCHIVE_COLLECTION = "predictions_archive"
+
+
+class PredictionArchive:
+    """Moves settled predictions out of the live ``predictions`` collection.
+
+    Predictions resolved more than ``min_age`` seconds ago, whose settlement
+    has finished, are copied in batches into ``predictions_archive`` and then
+    deleted from the live collection. The archive uses zstd block compression.
+    Copies are upserts by ``_id``, so a pass interrupted between copy and
+    delete is simply repeated. ``find_one`` and ``history`` read through both
+    collections, so archived markets stay reachable.
+    """
+
+    def __init__(self, db, batch_size=500, min_age=86400, interval=3600):
+        self.db = db
+        self.live = db.predictions
+        self.collection = db.db[ARCHIVE_COLLECTION]
+        self.batch_size = batch_size
+        self.min_age = min_age
+        self.interval = interval
+
+    async def ensure_collection(self):
+        if not await self.db.db.list_collection_names(filter={"name": ARCHIVE_COLLECTION}):
+            await self.db.db.create_collection(
+                ARCHIVE_COLLECTION,
+                storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}}
+            )
+        await self.collection.create_index([("creator_id", ASCENDING), ("_id", DESCENDING)])
+
+    async def archive_batch(self):
+        """Archive up to ``batch_size`` predictions; returns how many were moved."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.min_age)
+        predictions = await self.live.find({
+            "resolved": True,
+            # Predictions resolved before resolved_at was recorded are all old enough
+            "$or": [{"resolved_at": {"$lt": cutoff}}, {"resolved_at": {"$exists": False}}]
+        }).limit(self.batch_size).to_list(length=None)
+        if not predictions:
+            return 0
+
+        # Only settlements known to be finished; no record may mean one is about to start
+        settled = set(await self.db.settlement.records.distinct(
+            "_id", {"_id": {"$in": [p["_id"] for p in predictions]}, "status": "done"}
+        ))
+        predictions = [p for p in predictions if p["_id"] in settled]
+        if not predictions:
+            return 0
+
+        now = datetime.utcnow()
+        await self.collection.bulk_write([
+            ReplaceOne({"_id": p["_id"]}, {**p, "archived_at": now}, upsert=True)
+            for p in predictions
+        ], ordered=False)
+        result = await self.live.delete_many(
+            {"_id": {"$in": [p["_id"] for p in predictions]}, "resolved": True}
+        )
+        return result.deleted_count
+
+    async def run(self):
+        while True:
+            try:
+                moved = total = 0
+                while True:
+                    moved = await self.archive_batch()
+                    total += moved
+                    if moved < self.batch_size:
+                        break
+                if total:
+                    print(f"Archived {total} resolved predictions")
+            except Exception as e:
+                print(f"Error archiving predictions: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def find_one(self, prediction_id, projection=None):
+        prediction = await self.live.find_one({"_id": prediction_id}, projection)
+        if prediction is None:
+            prediction = await self.collection.find_one({"_id": prediction_id}, projection)
+        return prediction
+
+    async def history(self, creator_id, limit=10, projection=None):
+        """A creator's predictions across both collections, newest first."""
+        newest_first = [("_id", DESCENDING)]
+        live = await self.live.find(
+            {"creator_id": creator_id}, projection
+        ).sort(newest_first).to_list(length=limit)
+        archived = await self.collection.find(
+            {"creator_id": creator_id}, projection
+        ).sort(newest_first).to_list(length=limit)
+        # A copy left in the archive by an interrupted pass is skipped
+        merged = {prediction["_id"]: prediction for prediction in archived}
+        merged.update((prediction["_id"], prediction) for prediction in live)
+        return sorted(merged.values(), key=lambda prediction: prediction["_id"], reverse=True)[:limit]
@@ -0,0 +1,91 @@
+"""Bets per second on a single hot prediction, with and without BetBuffer.
+
+Needs a MongoDB; the scratch database given by ``--db`` is dropped between
+runs. From the repository root:
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.bets
+        [--bets 20000] [--concurrency 500] [--window 0.005] [--db bot_bets_bench]
+
+Every bet comes from a different user, as when a prediction goes viral.
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from ingest import BetBuffer
+
+
+async def seed(db, bets):
+    await db.client.drop_database(db.db.name)
+    await db.ensure_indexes()
+    for start in range(0, bets, 10000):
+        await db.users.insert_many([
+            {"user_id": user_id, "balance": 1000, "points": 0}
+            for user_id in range(start, min(start + 10000, bets))
+        ])
+    result = await db.predictions.insert_one({
+        "creator_id": -1, "question": "Hot prediction",
+        "created_at": datetime.utcnow(), "expiry_time": datetime.utcnow() + timedelta(days=1),
+        "options": ["Yes", "No"],
+        "bet_count": 0, "resolved": False, "result": None
+    })
+    return result.inserted_id
+
+
+async def measure(db, prediction_id, bets, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def bet(user_id):
+        async with semaphore:
+            started = time.perf_counter()
+            await db.place_bet(user_id, prediction_id, user_id % 2, 10)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(bet(user_id) for user_id in range(bets)))
+    elapsed = time.perf_counter() - started
+
+    await db.pool_counter.flush()
+    prediction = await db.predictions.find_one({"_id": prediction_id}, {"bet_count": 1})
+    stored = await db.bets.count_documents({"prediction_id": prediction_id})
+    assert prediction["bet_count"] == stored == bets, (prediction["bet_count"], stored)
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    return f"{bets / elapsed:8.0f} bets/s  p50={pct(0.5):6.1f}ms p99={pct(0.99):6.1f}ms"
+
+
+async def run(args):
+    from db import Database
+
+    db = Database(os.getenv("MONGO_URI", "mongodb://localhost:27017"), args.db)
+
+    prediction_id = await seed(db, args.bets)
+    print(f"per-bet writes : {await measure(db, prediction_id, args.bets, args.concurrency)}")
+
+    prediction_id = await seed(db, args.bets)
+    db.bet_buffer = BetBuffer(db, window=args.window)
+    report = await measure(db, prediction_id, args.bets, args.concurrency)
+    print(f"BetBuffer      : {report}  batches={db.bet_buffer.batches}")
+
+    await db.client.drop_database(args.db)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bets", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--window", type=float, default=0.005)
+    parser.add_argument("--db", default="bot_bets_bench")
+    args = parser.parse_args()
+    # Database requires these even though the benchmark does not use them
+    os.environ.setdefault("BOT_OWNER_ID", "1")
+    os.environ.setdefault("BOT_USERNAME", "bench_bot")
+    os.environ["BET_BUFFER"] = "0"
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Compare the old sequential notification loop with the Broadcaster.
+
+Run from the repository root:
+
+    python -m benchmarks.broadcast [--messages 2000] [--latency 0.05] [--limit 1000]
+
+The fake bot enforces ``--limit`` sends per second and the broadcaster is
+tuned to the same rate, so the run also shows how flood errors are handled.
+"""
+import argparse
+import asyncio
+import time
+
+from broadcast import Broadcaster
+from benchmarks.fakes import FakeBot
+
+
+async def sequential(bot, messages):
+    delivered = failed = 0
+    for chat_id, text in messages:
+        try:
+            await bot.send_message(chat_id, text)
+            delivered += 1
+        except Exception:
+            failed += 1
+    return {"delivered": delivered, "failed": failed}
+
+
+async def run(args):
+    messages = [(chat_id, f"Prediction resolved for {chat_id}") for chat_id in range(args.messages)]
+    blocked = range(0, args.messages, 50)
+
+    bot = FakeBot(latency=args.latency, limit=args.limit, blocked=blocked, error_rate=0.01)
+    started = time.perf_counter()
+    report = await sequential(bot, messages)
+    elapsed = time.perf_counter() - started
+    print(f"sequential : {elapsed:7.2f}s  {args.messages / elapsed:8.0f} msg/s  {report}")
+
+    bot = FakeBot(latency=args.latency, limit=args.limit, blocked=blocked, error_rate=0.01)
+    broadcaster = Broadcaster(bot, workers=args.workers, rate=args.limit * 0.9, backoff=0.05)
+    report = await broadcaster.send(messages)
+    print(
+        f"broadcaster: {report['seconds']:7.2f}s  {args.messages / report['seconds']:8.0f} msg/s  "
+        f"{report}  throttled by server: {bot.throttled}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""In-process stand-ins for Telegram used by the benchmarks."""
+import asyncio
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramNetworkError, TelegramBadRequest
+)
+from aiogram.methods import SendMessage
+from aiogram.types import Chat, Message
+
+
+class FakeBot:
+    """Mimics ``Bot.send_message`` with latency, flood control and failures.
+
+    More than ``limit`` sends inside one second raise ``RetryAfter``; chats
+    in ``blocked`` raise ``Forbidden``; ``error_rate`` of calls fail with a
+    transient network error.
+    """
+
+    def __init__(self, latency=0.05, limit=30, blocked=(), error_rate=0.0, seed=0):
+        self.latency = latency
+        self.limit = limit
+        self.blocked = set(blocked)
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.sent = []
+        self.throttled = 0
+        self._window = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.latency)
+        method = SendMessage(chat_id=chat_id, text=text)
+        now = time.monotonic()
+        self._window = [t for t in self._window if now - t < 1]
+        if len(self._window) >= self.limit:
+            self.throttled += 1
+            raise TelegramRetryAfter(method, "Too Many Requests", 1)
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(method, "bot was blocked by the user")
+        if self.random.random() < self.error_rate:
+            raise TelegramNetworkError(method, "connection reset")
+        self._window.append(now)
+        self.sent.append((chat_id, text))
+
+
+class FakeSession(BaseSession):
+    """Bot session that answers Bot API calls locally after ``latency`` seconds.
+
+    ``sendMessage`` and message edits return a synthetic ``Message``; methods
+    returning ``True`` succeed; anything else is rejected as a bad request.
+    Calls are counted per API method in ``calls``.
+    """
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[method.__api_method__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        returning = str(method.__returning__)
+        if "Message" in returning and "chat_id" in type(method).model_fields:
+            self._message_id += 1
+            chat_id = getattr(method, "chat_id", None) or 0
+            return Message(
+                message_id=getattr(method, "message_id", None) or self._message_id,
+                date=datetime.utcnow(),
+                chat=Chat(id=chat_id, type="private"),
+                text=getattr(method, "text", None)
+            )
+        if "bool" in returning:
+            return True
+        raise TelegramBadRequest(method, f"{method.__api_method__} is not simulated")
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        # No file downloads in the benchmarks; an empty stream
+        return
+        yield
+
+    async def close(self):
+        pass
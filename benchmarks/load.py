@@ -0,0 +1,275 @@
+"""Drive synthetic updates through the real dispatcher at several scales.
+
+Needs a MongoDB to write to. The scratch database given by ``--db`` is
+dropped and reseeded for every scale, so never point it at real data.
+From the repository root:
+
+    MONGO_URI=mongodb://localhost:27017 python -m benchmarks.load
+        [--users 1000,100000,1000000] [--bets 10000] [--requests 2000]
+        [--concurrency 50] [--latency 0] [--db bot_loadtest]
+
+Telegram is replaced by ``FakeSession``, so nothing leaves the machine.
+Each scale seeds users, active predictions and one hot prediction holding
+``--bets`` bets, then runs the flows in order: referral, predict, bet tap,
+bet amount, leaderboard and resolve. For every flow it reports latency
+percentiles, updates per second and Mongo commands per update, taken from
+the metrics command listener.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from aiogram.types import Update
+
+from benchmarks.fakes import FakeSession
+from callbacks import encode_bet, encode_resolve
+from metrics import MONGO_SECONDS, TelegramMetricsMiddleware
+
+OWNER_ID = 1
+BOT_ID = 10 ** 9
+PREDICTIONS = 50
+SEED_BATCH = 10000
+
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+
+class UpdateFactory:
+    """Builds Telegram updates as private-chat messages and button taps."""
+
+    def __init__(self):
+        self.update_id = 0
+
+    def _next_id(self):
+        self.update_id += 1
+        return self.update_id
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def _message(self, user_id, text):
+        return {
+            "message_id": self._next_id(),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+
+    def message(self, user_id, text):
+        update = {"update_id": self._next_id(), "message": self._message(user_id, text)}
+        if text.startswith("/"):
+            command = text.split()[0]
+            update["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return Update.model_validate(update)
+
+    def callback(self, user_id, data):
+        message = self._message(user_id, "menu")
+        message["from"] = {"id": BOT_ID, "is_bot": True, "first_name": "bot"}
+        return Update.model_validate({
+            "update_id": self._next_id(),
+            "callback_query": {
+                "id": str(self._next_id()),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "message": message,
+                "data": data,
+            }
+        })
+
+
+async def seed(main, users, bets):
+    db = main.db
+    await main.db.client.drop_database(db.db.name)
+    await db.ensure_indexes()
+    await main.outbox.ensure_indexes()
+    if isinstance(main.storage, main.MongoFSMStorage):
+        await main.storage.ensure_indexes()
+
+    rng = random.Random(users)
+    for start in range(1, users + 1, SEED_BATCH):
+        await db.users.insert_many([
+            {
+                "user_id": user_id, "balance": 10 ** 6, "points": rng.randint(0, 10000),
+                "wallet": None, "referrals": 0, "is_kol": False, "is_admin": False,
+                "timezone": "Asia/Dubai", "display_name": f"user{user_id}",
+            }
+            for user_id in range(start, min(start + SEED_BATCH, users + 1))
+        ], ordered=False)
+
+    # Every prediction has its own creator so resolves are not throttled as one user
+    now = datetime.utcnow()
+    predictions = [
+        {
+            "creator_id": index + 2, "question": f"Will event {index} happen?",
+            "created_at": now, "expiry_time": now + timedelta(days=1, minutes=index),
+            "options": ["Yes", "No"],
+            "bet_count": 0, "resolved": False, "result": None,
+        }
+        for index in range(PREDICTIONS)
+    ]
+    result = await db.predictions.insert_many(predictions)
+    prediction_ids = result.inserted_ids
+
+    hot = prediction_ids[0]
+    bets = min(bets, users)
+    for start in range(1, bets + 1, SEED_BATCH):
+        await db.bets.insert_many([
+            {
+                "prediction_id": hot, "user_id": user_id, "option": user_id % 2,
+                "choice": "Yes" if user_id % 2 == 0 else "No",
+                "amount": 10 + user_id % 91, "created_at": now,
+            }
+            for user_id in range(start, min(start + SEED_BATCH, bets + 1))
+        ], ordered=False)
+    pools = {
+        str(option): {
+            "amount": sum(10 + user_id % 91 for user_id in range(1, bets + 1) if user_id % 2 == option),
+            "bettors": sum(1 for user_id in range(1, bets + 1) if user_id % 2 == option)
+        }
+        for option in (0, 1)
+    }
+    await db.predictions.update_one({"_id": hot}, {"$set": {"bet_count": bets, "pools": pools}})
+
+    # Forget everything cached from the previous scale
+    db.profiles.clear()
+    db.leaderboard.invalidate()
+    main.names.cache.clear()
+    main.throttling.buckets.clear()
+    main.throttling.recent.clear()
+    main.feed.invalidate()
+    await db.load_rank_index()
+    return prediction_ids, bets
+
+
+def build_flows(factory, users, bets, prediction_ids, requests):
+    rng = random.Random(0)
+    hot = prediction_ids[0]
+    return [
+        ("referral", [
+            factory.message(users + 1 + i, f"/start ref_{rng.randint(1, users)}")
+            for i in range(requests)
+        ]),
+        ("predict", [
+            factory.callback(user_id, "predict")
+            for user_id in rng.sample(range(1, users + 1), min(requests, users))
+        ]),
+        # Bettors are fresh users so every tap gets past the duplicate check
+        ("bet_tap", [
+            factory.callback(bets + 1 + i, encode_bet(hot, i % 2))
+            for i in range(min(requests, users - bets))
+        ]),
+        ("bet_amount", [
+            factory.message(bets + 1 + i, "50")
+            for i in range(min(requests, users - bets))
+        ]),
+        ("leaderboard", [
+            factory.message(rng.randint(1, users), "/leaderboard")
+            for _ in range(requests)
+        ]),
+        ("resolve", [
+            factory.callback(index + 2, encode_resolve(prediction_id, 0))
+            for index, prediction_id in enumerate(prediction_ids)
+        ]),
+    ]
+
+
+async def run_flow(main, updates, concurrency):
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                await main.dp.feed_update(main.bot, update)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    mongo_before = MONGO_SECONDS.counts()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    # Let write-behind FSM writes land before the next flow reads them
+    if isinstance(main.storage, main.MongoFSMStorage):
+        await main.storage.flush()
+
+    mongo_ops = {}
+    for (_, command), count in MONGO_SECONDS.counts().items():
+        mongo_ops[command] = mongo_ops.get(command, 0) + count
+    for (_, command), count in mongo_before.items():
+        mongo_ops[command] -= count
+    latencies.sort()
+    return latencies, elapsed, errors, {command: n for command, n in mongo_ops.items() if n}
+
+
+async def run(args):
+    import main
+
+    session = FakeSession(latency=args.latency)
+    main.bot.session = session
+    main.bot.session.middleware(TelegramMetricsMiddleware())
+
+    for users in args.users:
+        factory = UpdateFactory()
+        started = time.perf_counter()
+        prediction_ids, bets = await seed(main, users, args.bets)
+        print(f"\n== {users} users, {bets} bets on the hot prediction "
+              f"(seeded in {time.perf_counter() - started:.1f}s) ==")
+        flows = build_flows(factory, users, bets, prediction_ids, args.requests)
+        for name, updates in flows:
+            if not updates:
+                continue
+            latencies, elapsed, errors, mongo_ops = await run_flow(main, updates, args.concurrency)
+            ops = " ".join(
+                f"{command}={count / len(updates):.2f}"
+                for command, count in sorted(mongo_ops.items(), key=lambda item: -item[1])
+            )
+            print(
+                f"{name:<12} n={len(updates):<6} {len(updates) / elapsed:8.0f}/s  "
+                f"p50={percentile(latencies, 0.5):7.1f}ms p95={percentile(latencies, 0.95):7.1f}ms "
+                f"p99={percentile(latencies, 0.99):7.1f}ms errors={errors}  mongo/update: {ops}"
+            )
+        started = time.perf_counter()
+        await main.db.settlement.drain()
+        print(f"background settlement finished {time.perf_counter() - started:.1f}s after the last resolve")
+        print(f"telegram calls: {dict(session.calls)}")
+        session.calls.clear()
+
+    await main.db.client.drop_database(main.db.db.name)
+    await session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="1000,100000,1000000",
+                        type=lambda value: [int(n) for n in value.split(",")])
+    parser.add_argument("--bets", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--db", default="bot_loadtest")
+    args = parser.parse_args()
+
+    # main.py reads its configuration at import time
+    os.environ["DB_NAME"] = args.db
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    os.environ.setdefault("BOT_TOKEN", "123456:" + "A" * 35)
+    os.environ.setdefault("BOT_OWNER_ID", str(OWNER_ID))
+    os.environ.setdefault("BOT_USERNAME", "loadtest_bot")
+    os.environ["METRICS_PORT"] = "0"
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
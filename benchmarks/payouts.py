@@ -0,0 +1,67 @@
+"""Time exact payout allocation on large pools against the old float loop.
+
+Run from the repository root:
+
+    python -m benchmarks.payouts [--bets 1000000] [--outcomes 2,10] [--fee-bps 250]
+
+For each outcome count it checks that payouts plus the fee equal the pool
+to the token, and reports how far the old per-winner float formula drifts.
+"""
+import argparse
+import random
+import time
+
+from payouts import allocate
+from settlement import compute_payouts
+
+
+def float_payouts(stakes, outcomes, winning):
+    # The pre-allocation formula: stake * pool / winning stake, per winner
+    pool = sum(stakes)
+    winning_total = sum(stake for stake, outcome in zip(stakes, outcomes) if outcome == winning)
+    return [
+        stake * pool / winning_total if outcome == winning else 0.0
+        for stake, outcome in zip(stakes, outcomes)
+    ]
+
+
+def run(args):
+    rng = random.Random(0)
+    stakes = [rng.randint(10, 100) for _ in range(args.bets)]
+    pool = sum(stakes)
+    for outcomes_count in args.outcomes:
+        outcomes = [rng.randrange(outcomes_count) for _ in range(args.bets)]
+        print(f"\n{args.bets} bets, {outcomes_count} outcomes, pool {pool}")
+
+        started = time.perf_counter()
+        legacy = float_payouts(stakes, outcomes, 0)
+        elapsed = time.perf_counter() - started
+        print(f"float loop      : {elapsed * 1000:8.1f}ms  paid {sum(legacy):.4f} (drift {sum(legacy) - pool:+.6f})")
+
+        started = time.perf_counter()
+        payouts, fee = allocate(stakes, outcomes, 0, args.fee_bps)
+        elapsed = time.perf_counter() - started
+        paid = int(payouts.sum())
+        assert paid + fee == pool
+        print(f"allocate        : {elapsed * 1000:8.1f}ms  paid {paid} + fee {fee} = {paid + fee}")
+
+        bets = [
+            {"user_id": user_id, "choice": str(outcome), "option": outcome, "amount": stake}
+            for user_id, (stake, outcome) in enumerate(zip(stakes, outcomes))
+        ]
+        started = time.perf_counter()
+        compute_payouts(bets, "0", 0, args.fee_bps)
+        elapsed = time.perf_counter() - started
+        print(f"compute_payouts : {elapsed * 1000:8.1f}ms  (including bet documents to arrays)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bets", type=int, default=1000000)
+    parser.add_argument("--outcomes", default="2,10", type=lambda value: [int(n) for n in value.split(",")])
+    parser.add_argument("--fee-bps", type=int, default=250)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Compare the old full-scan get_user_rank with the RankIndex lookup.
+
+Run from the repository root:
+
+    python -m benchmarks.rank [sizes...]
+
+Both paths run against synthetic in-memory users so the numbers isolate the
+algorithmic cost; the old path is measured without the Mongo transfer it
+also paid for.
+"""
+import random
+import sys
+import time
+
+from leaderboard import RankIndex
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+LOOKUPS = 200
+
+
+def make_users(n):
+    rng = random.Random(n)
+    return [{"user_id": uid, "points": rng.randint(0, 10_000)} for uid in range(1, n + 1)]
+
+
+def old_rank(users, user_id):
+    # The previous implementation: sort everything, build entries, scan
+    ordered = sorted(users, key=lambda u: u["points"], reverse=True)
+    leaderboard = [
+        {"rank": idx, "user_id": u["user_id"], "points": u["points"]}
+        for idx, u in enumerate(ordered, 1)
+    ]
+    for entry in leaderboard:
+        if entry["user_id"] == user_id:
+            return entry
+    return None
+
+
+def build_index(users):
+    index = RankIndex()
+    for user in users:
+        index.update(user["user_id"], user["points"])
+    index.loaded = True
+    return index
+
+
+def bench(n):
+    users = make_users(n)
+    targets = random.Random(0).sample(range(1, n + 1), LOOKUPS)
+
+    old_runs = max(1, min(LOOKUPS, 2_000_000 // n))
+    start = time.perf_counter()
+    for user_id in targets[:old_runs]:
+        old_rank(users, user_id)
+    old_per_call = (time.perf_counter() - start) / old_runs
+
+    start = time.perf_counter()
+    index = build_index(users)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for user_id in targets:
+        index.rank(user_id)
+    new_per_call = (time.perf_counter() - start) / LOOKUPS
+
+    start = time.perf_counter()
+    for user_id in targets:
+        index.update(user_id, index.points[user_id] + 10)
+    update_per_call = (time.perf_counter() - start) / LOOKUPS
+
+    print(
+        f"{n:>9} users | old {old_per_call * 1e3:10.2f} ms/lookup | "
+        f"new {new_per_call * 1e6:7.2f} us/lookup | "
+        f"update {update_per_call * 1e6:7.2f} us | "
+        f"index build {build_time:6.2f} s | "
+        f"speedup {old_per_call / new_per_call:,.0f}x"
+    )
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES
+    for n in sizes:
+        bench(n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Post recorded updates to a running webhook endpoint.
+
+Run the bot with BOT_MODE=webhook (WEBHOOK_URL can be left unset locally),
+then from the repository root:
+
+    python -m benchmarks.replay updates.jsonl [--url http://localhost:8080/webhook]
+        [--secret $WEBHOOK_SECRET] [--concurrency 50] [--repeat 1]
+
+``updates.jsonl`` holds one Telegram Update JSON object per line. Reports
+acknowledgement latency and requests per second.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+
+from webhook import SECRET_HEADER
+
+
+async def run(args):
+    with open(args.updates) as f:
+        updates = [json.loads(line) for line in f if line.strip()] * args.repeat
+    headers = {SECRET_HEADER: args.secret} if args.secret else {}
+    queue = asyncio.Queue()
+    for update_id, update in enumerate(updates, 1):
+        queue.put_nowait(dict(update, update_id=update_id))
+
+    latencies, statuses = [], {}
+
+    async def worker(session):
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            async with session.post(args.url, json=update, headers=headers) as response:
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(f"{len(latencies)} updates in {elapsed:.2f}s ({len(latencies) / elapsed:.0f}/s) statuses={statuses}")
+    print(f"ack latency p50={pct(0.5):.1f}ms p95={pct(0.95):.1f}ms p99={pct(0.99):.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("updates")
+    parser.add_argument("--url", default="http://localhost:8080/webhook")
+    parser.add_argument("--secret")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Updates per second against worker-process count for the sharded mode.
+
+Run from the repository root:
+
+    python -m benchmarks.sharding [--updates 5000] [--users 500] [--work-ms 2] [--workers 1 2 4]
+
+Each worker runs a real aiogram Dispatcher whose handler burns ``--work-ms``
+of CPU, standing in for handler and (de)serialisation cost. The run also
+checks that every user's updates were handled in the order they were sent.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.types import Update, Message, Chat, User
+
+from sharding import Supervisor, consume
+
+TOKEN = "123456:ABCdefGhIJKlmNoPQRsTUVwxyZ12345678"
+
+
+def bench_worker(index, updates, results, work_ms):
+    bot = Bot(token=TOKEN)
+    dp = Dispatcher()
+
+    @dp.message()
+    async def handler(message: types.Message):
+        deadline = time.perf_counter() + work_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+        results.put((message.from_user.id, int(message.text)))
+
+    async def handle(payload):
+        await dp.feed_update(bot, Update.model_validate_json(payload, context={"bot": bot}))
+
+    asyncio.run(consume(updates, handle))
+
+
+def make_update(update_id, user_id, seq):
+    user = User(id=user_id, is_bot=False, first_name=f"user{user_id}")
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=datetime.utcnow(), text=str(seq),
+        chat=Chat(id=user_id, type="private"), from_user=user
+    ))
+
+
+def run(workers, args):
+    results = multiprocessing.get_context("spawn").Queue()
+    supervisor = Supervisor(workers, target=bench_worker, args=(results, args.work_ms))
+    supervisor.start()
+    updates = [
+        make_update(i, 1000 + i % args.users, i // args.users)
+        for i in range(args.updates)
+    ]
+    # Warm up every worker so process start-up is not measured
+    for index in range(workers):
+        supervisor.route(make_update(10**9 + index, index, -1))
+    for _ in range(workers):
+        results.get()
+
+    started = time.perf_counter()
+    for update in updates:
+        supervisor.route(update)
+    last_seq, out_of_order = {}, 0
+    for _ in updates:
+        user_id, seq = results.get()
+        if seq < last_seq.get(user_id, -1):
+            out_of_order += 1
+        last_seq[user_id] = seq
+    elapsed = time.perf_counter() - started
+    supervisor.stop()
+    print(f"{workers:>2} workers: {args.updates / elapsed:8.0f} updates/s  out of order: {out_of_order}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--work-ms", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    for workers in args.workers:
+        run(workers, args)
+
+
+if __name__ == "__main__":
+    main()
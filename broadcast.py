@@ -0,0 +1,122 @@
+import asyncio
+import time
+from aiogram.exceptions import (
+    TelegramRetryAfter,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramServerError,
+)
+
+# Telegram allows roughly 30 messages per second overall and about one
+# message per second to the same chat.
+GLOBAL_RATE = 30
+CHAT_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, bursts up to ``capacity``."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Broadcaster:
+    """Sends many messages concurrently while respecting Telegram's limits.
+
+    A bounded pool of workers shares one global token bucket. Same-chat
+    messages are spaced by ``chat_interval``. ``RetryAfter`` pauses every
+    worker for the requested time, and network or server errors are retried
+    with exponential backoff.
+    """
+
+    def __init__(self, bot, workers=20, rate=GLOBAL_RATE, chat_interval=CHAT_INTERVAL,
+                 max_attempts=5, backoff=0.5):
+        self.bot = bot
+        self.workers = workers
+        # No burst allowance: spread sends evenly so no one-second window overflows
+        self.bucket = TokenBucket(rate, capacity=1)
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._paused_until = 0.0
+        self._last_sent = {}
+
+    async def send(self, messages):
+        """Deliver ``(chat_id, text)`` pairs and return delivery counts."""
+        queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+
+        report = {"delivered": 0, "failed": 0, "blocked": 0, "retried": 0}
+        started = time.perf_counter()
+        workers = [
+            asyncio.create_task(self._worker(queue, report))
+            for _ in range(min(self.workers, queue.qsize()))
+        ]
+        await asyncio.gather(*workers)
+        report["seconds"] = time.perf_counter() - started
+        return report
+
+    async def _worker(self, queue, report):
+        while not queue.empty():
+            chat_id, text = queue.get_nowait()
+            report[await self.deliver(chat_id, text, report)] += 1
+
+    async def deliver(self, chat_id, text, report=None):
+        """Send one message; returns "delivered", "blocked" or "failed".
+
+        Flood-wait replies pause every worker and are retried without using
+        up one of the ``max_attempts``.
+        """
+        attempt = 0
+        while attempt < self.max_attempts:
+            await self._wait_turn(chat_id)
+            try:
+                await self.bot.send_message(chat_id, text)
+                return "delivered"
+            except TelegramRetryAfter as e:
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            except TelegramForbiddenError:
+                return "blocked"
+            except (TelegramNetworkError, TelegramServerError):
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+            except Exception as e:
+                # Anything else would escape gather() and strand the whole batch
+                print(f"Error sending message to user {chat_id}: {e}")
+                return "failed"
+            if report is not None:
+                report["retried"] += 1
+        print(f"Giving up on message to user {chat_id} after {self.max_attempts} attempts")
+        return "failed"
+
+    async def _wait_turn(self, chat_id):
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        wait = self._last_sent.get(chat_id, 0.0) + self.chat_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await self.bucket.acquire()
+        self._last_sent[chat_id] = time.monotonic()
+        if len(self._last_sent) > 100000:
+            self._last_sent.clear()
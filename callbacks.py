@@ -0,0 +1,102 @@
+"""Compact binary callback data.
+
+Every payload is ``version, kind`` followed by a fixed layout per kind,
+packed with ``struct`` and base64url-encoded without padding. A bet or
+resolve button carries the 12-byte ObjectId plus the option index (20
+characters), well inside Telegram's 64-byte limit whatever the option text.
+Decoding never touches the database: anything malformed, of another version
+or of the wrong length decodes to ``None``.
+"""
+import base64
+import binascii
+import struct
+from collections import namedtuple
+from datetime import datetime, timedelta
+from aiogram.filters import Filter
+from bson import ObjectId
+
+VERSION = 1
+
+BET = 1
+RESOLVE = 2
+TZ = 3
+PAGE = 4
+
+KIND_NAMES = {BET: "bet", RESOLVE: "resolve", TZ: "tz", PAGE: "page"}
+
+_HEADER = struct.Struct("!BB")
+_LAYOUTS = {
+    BET: struct.Struct("!BB12sB"),
+    RESOLVE: struct.Struct("!BB12sB"),
+    TZ: struct.Struct("!BBB"),
+    PAGE: struct.Struct("!BB12sBq"),
+}
+
+# Preset timezone buttons; TZ_CUSTOM asks the user to type one
+TIMEZONES = ["Asia/Dubai", "Europe/London", "America/New_York"]
+TZ_CUSTOM = 255
+
+EPOCH = datetime(1970, 1, 1)
+
+Callback = namedtuple("Callback", ["kind", "prediction_id", "option", "expiry_time"])
+
+
+def _encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def encode_bet(prediction_id, option):
+    return _encode(_LAYOUTS[BET].pack(VERSION, BET, ObjectId(prediction_id).binary, option))
+
+
+def encode_resolve(prediction_id, option):
+    return _encode(_LAYOUTS[RESOLVE].pack(VERSION, RESOLVE, ObjectId(prediction_id).binary, option))
+
+
+def encode_tz(index):
+    return _encode(_LAYOUTS[TZ].pack(VERSION, TZ, index))
+
+
+def encode_page(prediction, forward):
+    # Mongo keeps millisecond precision, so the cursor round-trips exactly
+    millis = (prediction["expiry_time"] - EPOCH) // timedelta(milliseconds=1)
+    return _encode(_LAYOUTS[PAGE].pack(
+        VERSION, PAGE, prediction["_id"].binary, 1 if forward else 0, millis
+    ))
+
+
+def decode(data):
+    if not data or len(data) > 64:
+        return None
+    try:
+        raw = base64.b64decode(data + "=" * (-len(data) % 4), altchars=b"-_", validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if len(raw) < _HEADER.size:
+        return None
+    version, kind = _HEADER.unpack_from(raw)
+    layout = _LAYOUTS.get(kind)
+    if version != VERSION or layout is None or len(raw) != layout.size:
+        return None
+
+    fields = layout.unpack(raw)[2:]
+    if kind == TZ:
+        return Callback(kind, None, fields[0], None)
+    if kind == PAGE:
+        oid, forward, millis = fields
+        return Callback(kind, ObjectId(oid), forward, EPOCH + timedelta(milliseconds=millis))
+    oid, option = fields
+    return Callback(kind, ObjectId(oid), option, None)
+
+
+class CallbackKind(Filter):
+    """Matches callbacks of one kind and passes the decoded payload as ``cb``."""
+
+    def __init__(self, kind):
+        self.kind = kind
+
+    async def __call__(self, callback_query):
+        cb = decode(callback_query.data)
+        if cb is None or cb.kind != self.kind:
+            return False
+        return {"cb": cb}
@@ -1,47 +1,220 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
 from datetime import datetime
 import os
 from pytz import timezone, UnknownTimeZoneError
+from pymongo import ReturnDocument, InsertOne, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+from leaderboard import Leaderboard, RankIndex
+from cache import TTLCache
+from settlement import SettlementEngine
+from scheduler import DeadlineScheduler
+from ingest import BetBuffer
+from pools import PoolCounter
+from archive import PredictionArchive
+
+def _has_stage(plan, stage):
+    if isinstance(plan, dict):
+        if plan.get("stage") == stage:
+            return True
+        return any(_has_stage(value, stage) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_stage(item, stage) for item in plan)
+    return False
+
+# Prediction documents are read without per-bet data
+PREDICTION_PROJECTION = {"bets": 0}
+
+DUPLICATE_KEY = 11000
+
+# Outcomes per prediction; prediction["options"] is an array and bets refer to indexes in it
+MIN_OPTIONS = 2
+MAX_OPTIONS = 10
+
+def check_option(option):
+    if not 0 <= option < MAX_OPTIONS:
+        raise ValueError("Invalid choice")
 
 class Database:
-    def __init__(self, mongo_uri, db_name):
-        self.client = AsyncIOMotorClient(mongo_uri)
+    def __init__(self, mongo_uri, db_name, event_listeners=None):
+        self.client = AsyncIOMotorClient(mongo_uri, event_listeners=event_listeners or [])
         self.db = self.client[db_name]
         self.users = self.db["users"]
         self.predictions = self.db["predictions"]
+        self.bets = self.db["bets"]
+        self.leaderboard = Leaderboard(
+            self.users,
+            self.db["leaderboard"],
+            size=int(os.getenv("LEADERBOARD_SIZE", 100)),
+            max_age=int(os.getenv("LEADERBOARD_MAX_AGE", 60))
+        )
+        self.ranks = RankIndex()
+        # In-memory rankings only see points changes made by this process
+        self.single_process = int(os.getenv("BOT_WORKERS", 1)) == 1
+        self.use_rank_index = self.single_process and os.getenv("RANK_INDEX", "1") == "1"
+        self.settlement = SettlementEngine(self, fee_bps=int(os.getenv("HOUSE_FEE_BPS", 0)))
+        self.deadlines = DeadlineScheduler()
+        self.archive = PredictionArchive(
+            self,
+            batch_size=int(os.getenv("ARCHIVE_BATCH_SIZE", 500)),
+            min_age=int(os.getenv("ARCHIVE_AFTER", 86400)),
+            interval=int(os.getenv("ARCHIVE_INTERVAL", 3600))
+        )
+        # Open/expiry/options of predictions being bet on, checked without a query
+        self.bet_predictions = TTLCache(maxsize=10000, ttl=1)
+        self.pool_counter = PoolCounter(
+            self.predictions, interval=float(os.getenv("POOL_FLUSH_INTERVAL", 1))
+        )
+        self.bet_buffer = None
+        if os.getenv("BET_BUFFER", "0") == "1":
+            self.bet_buffer = BetBuffer(
+                self,
+                window=float(os.getenv("BET_BUFFER_WINDOW", 0.005)),
+                max_batch=int(os.getenv("BET_BUFFER_MAX_BATCH", 500))
+            )
+        self.profiles = TTLCache(
+            maxsize=int(os.getenv("USER_CACHE_SIZE", 10000)),
+            ttl=int(os.getenv("USER_CACHE_TTL", 30))
+        )
         self.bot_owner_id = int(os.getenv("BOT_OWNER_ID"))
         self.BOT_USERNAME = os.getenv("BOT_USERNAME")
         if not self.BOT_USERNAME:
             raise ValueError("BOT_USERNAME environment variable is not set")
 
+    async def ensure_indexes(self):
+        """Create every index the queries in this class rely on."""
+        await self.users.create_index([("user_id", ASCENDING)], unique=True)
+        # Backs the leaderboard sort and rank counting
+        await self.users.create_index([("points", DESCENDING), ("user_id", ASCENDING)])
+        # Settlement idempotency markers, pulled once a settlement completes
+        await self.users.create_index([("settlements", ASCENDING)], sparse=True)
+        # Active predictions feed
+        await self.predictions.create_index(
+            [("resolved", ASCENDING), ("expiry_time", ASCENDING), ("_id", ASCENDING)]
+        )
+        # Draft lookups ({creator_id, expiry_time: None}) and /resolve listings
+        await self.predictions.create_index([("creator_id", ASCENDING), ("expiry_time", ASCENDING)])
+        await self.predictions.create_index([("creator_id", ASCENDING), ("resolved", ASCENDING)])
+        # One bet per user per prediction; also serves per-prediction bet scans
+        await self.bets.create_index(
+            [("prediction_id", ASCENDING), ("user_id", ASCENDING)], unique=True
+        )
+        # Frozen settlement bet sets and the late bet sweep ({settled: {$ne: True}})
+        await self.bets.create_index([("prediction_id", ASCENDING), ("settled", ASCENDING)])
+        # Claimable settlements ({status: "running", lease expired}) polled by every worker
+        await self.settlement.records.create_index([("status", ASCENDING), ("lease_until", ASCENDING)])
+        # Recently finished settlements swept for late bets
+        await self.settlement.records.create_index([("status", ASCENDING), ("finished_at", ASCENDING)])
+
+    def _query_shapes(self):
+        now = datetime.utcnow()
+        return [
+            ("users by user_id", self.users, {"user_id": 0}, None),
+            ("leaderboard", self.users, {}, [("points", DESCENDING), ("user_id", ASCENDING)]),
+            ("rank count", self.users, {"$or": [
+                {"points": {"$gt": 0}},
+                {"points": 0, "user_id": {"$lt": 0}}
+            ]}, None),
+            ("display names", self.users, {"user_id": {"$in": [0]}, "display_name": {"$ne": None}}, None),
+            ("active predictions", self.predictions, {"resolved": False, "expiry_time": {"$gt": now}}, None),
+            ("active predictions page", self.predictions,
+             self._active_page_query((now, ObjectId()), ASCENDING),
+             [("expiry_time", ASCENDING), ("_id", ASCENDING)]),
+            ("pending deadlines", self.predictions, self._pending_deadlines_query(), None),
+            ("prediction drafts", self.predictions, {"creator_id": 0, "expiry_time": None}, None),
+            ("user predictions", self.predictions, {"creator_id": 0, "resolved": False}, None),
+            ("user bet", self.bets, {"prediction_id": ObjectId(), "user_id": 0}, None),
+            ("prediction bets", self.bets, {"prediction_id": ObjectId()}, None),
+        ]
+
+    async def verify_query_plans(self):
+        """Explain every query shape and raise if any falls back to a COLLSCAN."""
+        failures = []
+        for name, collection, query, sort in self._query_shapes():
+            cursor = collection.find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            plan = await cursor.explain()
+            if _has_stage(plan.get("queryPlanner", {}).get("winningPlan", {}), "COLLSCAN"):
+                failures.append(f"{name} ({collection.name}: {query})")
+        if failures:
+            raise RuntimeError("Queries without index support: " + "; ".join(failures))
+
+    async def load_rank_index(self):
+        if self.use_rank_index:
+            await self.ranks.load(self.users)
+
+    def _points_changed(self, user_id, points):
+        # Sharded workers share the Mongo snapshot instead of patching their own copy
+        if self.single_process:
+            self.leaderboard.record(user_id, points)
+        if self.ranks.loaded:
+            self.ranks.update(user_id, points)
+
+    async def get_user(self, user_id):
+        """Read-through cached user document. Treat the result as read-only."""
+        user = self.profiles.get(user_id)
+        if user is None:
+            user = await self.users.find_one({"user_id": user_id})
+            if user:
+                self.profiles.set(user_id, user)
+        return user
+
+    def _invalidate_user(self, *user_ids):
+        for user_id in user_ids:
+            self.profiles.pop(user_id)
+
+    def cache_stats(self):
+        return self.profiles.stats()
+
     async def create_user(self, user_id):
-        existing_user = await self.users.find_one({"user_id": user_id})
+        existing_user = await self.get_user(user_id)
         if not existing_user:
-            await self.users.insert_one(
-                {
-                    "user_id": user_id,
+            # An upsert, so concurrent /start updates cannot trip the unique index
+            result = await self.users.update_one(
+                {"user_id": user_id},
+                {"$setOnInsert": {
                     "balance": 100,  # Default token balance
                     "points": 50,    # Default points
                     "wallet": None,
                     "referrals": 0,
                     "is_kol": False,
                     "is_admin": False
-                }
+                }},
+                upsert=True
             )
+            self._invalidate_user(user_id)
+            if result.upserted_id is not None:
+                self._points_changed(user_id, 50)
 
     async def update_user_wallet(self, user_id, wallet_address):
         await self.users.update_one(
             {"user_id": user_id},
             {"$set": {"wallet": wallet_address}}
         )
+        self._invalidate_user(user_id)
+
+    async def set_display_name(self, user_id, name):
+        await self.users.update_one(
+            {"user_id": user_id},
+            {"$set": {"display_name": name}}
+        )
+        self._invalidate_user(user_id)
+
+    async def get_display_names(self, user_ids):
+        cursor = self.users.find(
+            {"user_id": {"$in": list(user_ids)}, "display_name": {"$ne": None}},
+            {"_id": 0, "user_id": 1, "display_name": 1}
+        )
+        return {user["user_id"]: user["display_name"] async for user in cursor}
 
     async def get_user_balance(self, user_id):
-        user = await self.users.find_one({"user_id": user_id})
+        user = await self.get_user(user_id)
         return user["balance"] if user else 0
 
     async def get_user_points(self, user_id):
-        user = await self.users.find_one({"user_id": user_id})
+        user = await self.get_user(user_id)
         return user["points"] if user else 0
 
     async def add_prediction_draft(self, user_id, question):
@@ -50,97 +223,362 @@ class Database:
             "question": question,
             "created_at": datetime.utcnow(),
             "expiry_time": None,
-            "options": {
-                "option1": None,
-                "option2": None
-            },
-            "bets": [],
+            "options": [],
+            "bet_count": 0,
+            "pools": {},
             "resolved": False,
             "result": None
         })
 
-    async def update_prediction_options(self, user_id, option1, option2):
-        await self.predictions.update_one(
-            {"creator_id": user_id, "expiry_time": None},
-            {"$set": {
-                "options.option1": option1,
-                "options.option2": option2
-            }}
+    async def add_prediction_option(self, user_id, text):
+        """Append an outcome to the user's draft; returns the new count, or None if full."""
+        draft = await self.predictions.find_one_and_update(
+            {"creator_id": user_id, "expiry_time": None, f"options.{MAX_OPTIONS - 1}": {"$exists": False}},
+            {"$push": {"options": text}},
+            projection={"options": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return len(draft["options"]) if draft else None
+
+    async def migrate_options(self):
+        """Convert predictions stored with options.option1/option2 to an options array."""
+        result = await self.predictions.update_many(
+            {"options.option1": {"$exists": True}},
+            [{"$set": {"options": {"$filter": {
+                "input": ["$options.option1", "$options.option2"],
+                "cond": {"$ne": ["$$this", None]}
+            }}}}]
         )
+        return result.modified_count
+
+    async def migrate_bets(self, batch_size=1000):
+        """Move bets still embedded in ``predictions.bets`` into the bets collection.
+
+        Returns how many embedded bets were processed. Duplicates are dropped
+        by the unique index, and each array is removed only once its bets
+        are stored, with ``bet_count`` set from what was stored.
+        """
+        requests, pending = [], []
+        moved = 0
+        cursor = self.predictions.find(
+            {"bets.0": {"$exists": True}},
+            {"bets": 1, "created_at": 1, "options": 1}
+        )
+        async for prediction in cursor:
+            options = prediction.get("options") or []
+            if isinstance(options, dict):
+                options = [options.get("option1"), options.get("option2")]
+            choices = {label: option for option, label in enumerate(options)}
+            for bet in prediction["bets"]:
+                requests.append(InsertOne({
+                    "prediction_id": prediction["_id"],
+                    "user_id": bet["user_id"],
+                    "choice": bet["choice"],
+                    "option": choices.get(bet["choice"]),
+                    "amount": bet["amount"],
+                    "created_at": prediction.get("created_at") or datetime.utcnow()
+                }))
+            pending.append(prediction["_id"])
+            moved += len(prediction["bets"])
+            if len(requests) >= batch_size:
+                await self._store_migrated_bets(requests, pending)
+                requests, pending = [], []
+        await self._store_migrated_bets(requests, pending)
+        return moved
+
+    async def _store_migrated_bets(self, requests, prediction_ids):
+        if requests:
+            try:
+                await self.bets.bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                if any(err["code"] != DUPLICATE_KEY for err in e.details["writeErrors"]):
+                    raise
+        # Embedded arrays are dropped only once their bets are durable elsewhere.
+        # Count what was stored: duplicate bets in an array are rejected by the index
+        for prediction_id in prediction_ids:
+            bet_count = await self.bets.count_documents({"prediction_id": prediction_id})
+            await self.predictions.update_one(
+                {"_id": prediction_id},
+                {"$unset": {"bets": ""}, "$set": {"bet_count": bet_count}}
+            )
 
     async def finalize_prediction(self, user_id, expiry_time):
-        await self.predictions.update_one(
-            {"creator_id": user_id, "expiry_time": None},
-            {"$set": {"expiry_time": expiry_time}}
+        prediction = await self.predictions.find_one_and_update(
+            {"creator_id": user_id, "expiry_time": None, f"options.{MIN_OPTIONS - 1}": {"$exists": True}},
+            {"$set": {"expiry_time": expiry_time}},
+            projection={"_id": 1, "expiry_time": 1},
+            return_document=ReturnDocument.AFTER
         )
+        if prediction:
+            self.deadlines.add(prediction["_id"], prediction["expiry_time"])
+        return prediction
 
-    async def get_active_predictions(self):
+    def _pending_deadlines_query(self):
+        return {"resolved": False, "expiry_time": {"$ne": None}, "closed": {"$ne": True}}
+
+    async def load_deadlines(self):
+        await self.deadlines.load(
+            self.predictions.find(self._pending_deadlines_query(), {"expiry_time": 1})
+        )
+
+    async def close_prediction(self, prediction_id):
+        """Mark an expired prediction closed; returns it, or None if already handled."""
+        return await self.predictions.find_one_and_update(
+            {"_id": ObjectId(prediction_id), "resolved": False, "closed": {"$ne": True}},
+            {"$set": {"closed": True, "closed_at": datetime.utcnow()}},
+            projection=PREDICTION_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def get_active_predictions(self, limit=10):
         return await self.predictions.find(
-            {"resolved": False, "expiry_time": {"$gt": datetime.utcnow()}}
-        ).to_list(length=10)
+            {"resolved": False, "expiry_time": {"$gt": datetime.utcnow()}},
+            PREDICTION_PROJECTION
+        ).sort([("expiry_time", ASCENDING), ("_id", ASCENDING)]).to_list(length=limit)
+
+    async def get_prediction_pools(self, prediction_id):
+        prediction = await self.predictions.find_one({"_id": prediction_id}, {"pools": 1})
+        return (prediction or {}).get("pools") or {}
+
+    def _active_page_query(self, cursor, direction):
+        query = {"resolved": False, "expiry_time": {"$gt": datetime.utcnow()}}
+        if cursor:
+            expiry_time, prediction_id = cursor
+            op = "$gt" if direction == ASCENDING else "$lt"
+            query["$or"] = [
+                {"expiry_time": {op: expiry_time}},
+                {"expiry_time": expiry_time, "_id": {op: prediction_id}}
+            ]
+        return query
+
+    async def get_active_predictions_page(self, cursor=None, direction=ASCENDING, limit=1):
+        """Active predictions strictly after (or before) an (expiry_time, _id) cursor.
+
+        Returns the page in ascending order and whether more rows lie beyond it.
+        """
+        predictions = await self.predictions.find(
+            self._active_page_query(cursor, direction), PREDICTION_PROJECTION
+        ).sort([("expiry_time", direction), ("_id", direction)]).to_list(length=limit + 1)
+        has_more = len(predictions) > limit
+        predictions = predictions[:limit]
+        if direction == DESCENDING:
+            predictions.reverse()
+        return predictions, has_more
 
     async def get_user_predictions(self, user_id, active_only=False):
-        query = {"creator_id": user_id}
         if active_only:
-            query["resolved"] = False
-        return await self.predictions.find(query).to_list(length=10)
-
-    async def place_bet(self, user_id, prediction_id, choice, amount):
-        prediction = await self.predictions.find_one({"_id": ObjectId(prediction_id)})
+            return await self.predictions.find(
+                {"creator_id": user_id, "resolved": False}, PREDICTION_PROJECTION
+            ).to_list(length=10)
+        # History reads through to predictions that have been archived
+        return await self.archive.history(user_id, limit=10, projection=PREDICTION_PROJECTION)
+
+    async def get_prediction(self, prediction_id):
+        return await self.archive.find_one(ObjectId(prediction_id), PREDICTION_PROJECTION)
+
+    async def place_bet(self, user_id, prediction_id, option, amount):
+        """Validate the prediction, debit the stake and record the bet.
+
+        Returns the text of the chosen option. The prediction is checked
+        against a copy cached for a second, so a hot bet costs two
+        conditional writes: the debit only matches while the balance covers
+        the stake, and the unique (prediction_id, user_id) index rejects a
+        second bet, in which case the debit is refunded. A bet that lands
+        just after resolution is refunded by the settlement's late bet sweep.
+        The prediction's bet count and pools are bumped through the batching
+        ``PoolCounter``. With BET_BUFFER enabled, bets go through the
+        coalescing ``BetBuffer``.
+        """
+        prediction_id = ObjectId(prediction_id)
+        if self.bet_buffer:
+            choice = await self.bet_buffer.place(user_id, prediction_id, option, amount)
+        else:
+            choice = await self._place_bet(user_id, prediction_id, option, amount)
+            self.pool_counter.add(prediction_id, option, amount)
+        self._invalidate_user(user_id)
+        return choice
+
+    async def bet_choice(self, prediction_id, option):
+        """Text of ``option`` if the prediction takes bets on it, going by the cached copy."""
+        check_option(option)
+        prediction = self.bet_predictions.get(prediction_id)
+        if prediction is None:
+            prediction = await self.predictions.find_one(
+                {"_id": prediction_id},
+                {"options": 1, "expiry_time": 1, "resolved": 1}
+            )
+            if prediction:
+                self.bet_predictions.set(prediction_id, prediction)
         if not prediction or prediction["resolved"]:
             raise ValueError("Prediction not found or already resolved.")
-        
-        if choice not in [prediction["options"]["option1"], prediction["options"]["option2"]]:
+        if not prediction.get("expiry_time") or prediction["expiry_time"] <= datetime.utcnow():
+            raise ValueError("Betting on this prediction has closed.")
+        if option >= len(prediction["options"]):
             raise ValueError("Invalid choice")
+        return prediction["options"][option]
 
-        user = await self.users.find_one({"user_id": user_id})
-        if not user or user["balance"] < amount:
-            raise ValueError("Insufficient balance.")
+    async def _place_bet(self, user_id, prediction_id, option, amount):
+        choice = await self.bet_choice(prediction_id, option)
 
-        await self.users.update_one(
-            {"user_id": user_id},
+        debited = await self.users.update_one(
+            {"user_id": user_id, "balance": {"$gte": amount}},
             {"$inc": {"balance": -amount}}
         )
-        await self.predictions.update_one(
-            {"_id": ObjectId(prediction_id)},
-            {"$push": {"bets": {"user_id": user_id, "choice": choice, "amount": amount}}}
+        if not debited.modified_count:
+            raise ValueError("Insufficient balance.")
+
+        try:
+            await self.bets.insert_one({
+                "prediction_id": prediction_id,
+                "user_id": user_id,
+                "choice": choice,
+                "option": option,
+                "amount": amount,
+                "created_at": datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            await self.users.update_one(
+                {"user_id": user_id},
+                {"$inc": {"balance": amount}}
+            )
+            raise ValueError("You have already placed a bet on this prediction!")
+        return choice
+
+    async def _bet_rejection_reason(self, prediction_id):
+        # Only runs on the failure path, to explain why the bet did not match
+        prediction = await self.predictions.find_one(
+            {"_id": prediction_id},
+            {"resolved": 1, "expiry_time": 1, "options": 1}
         )
+        if not prediction or prediction["resolved"]:
+            return "Prediction not found or already resolved."
+        if not prediction["expiry_time"] or prediction["expiry_time"] <= datetime.utcnow():
+            return "Betting on this prediction has closed."
+        return "Invalid choice"
+
+    async def get_prediction_bets(self, prediction_id, settled=False):
+        """A prediction's bets; with ``settled``, only those frozen into its settlement."""
+        query = {"prediction_id": ObjectId(prediction_id)}
+        if settled:
+            query["settled"] = True
+        return await self.bets.find(
+            query,
+            {"_id": 0, "user_id": 1, "choice": 1, "option": 1, "amount": 1}
+        ).to_list(length=None)
+
+    async def pool_totals(self, prediction_ids):
+        """Per-option stake and bettor totals summed from the bets themselves."""
+        totals = {prediction_id: {} for prediction_id in prediction_ids}
+        cursor = self.bets.aggregate([
+            {"$match": {"prediction_id": {"$in": list(prediction_ids)}}},
+            {"$group": {
+                "_id": {"prediction_id": "$prediction_id", "option": "$option"},
+                "amount": {"$sum": "$amount"},
+                "bettors": {"$sum": 1}
+            }}
+        ])
+        async for row in cursor:
+            totals[row["_id"]["prediction_id"]][str(row["_id"]["option"])] = {
+                "amount": row["amount"],
+                "bettors": row["bettors"]
+            }
+        return totals
+
+    async def reconcile_pools(self, settle_delay=5):
+        """Check open predictions' pool counters against their bets and repair drift.
+
+        Returns the ids of corrected predictions. A mismatch must still be
+        there ``settle_delay`` seconds later, so bets whose counter update is
+        still waiting to be flushed are not mistaken for drift. The fix is
+        only written if ``bet_count`` has not moved in the meantime.
+        """
+        async def mismatches(query):
+            predictions = await self.predictions.find(
+                query, {"pools": 1, "bet_count": 1}
+            ).to_list(length=None)
+            totals = await self.pool_totals([prediction["_id"] for prediction in predictions])
+            found = {}
+            for prediction in predictions:
+                actual = totals[prediction["_id"]]
+                recorded = {
+                    option: {"amount": pool.get("amount", 0), "bettors": pool.get("bettors", 0)}
+                    for option, pool in (prediction.get("pools") or {}).items()
+                    if pool.get("amount") or pool.get("bettors")
+                }
+                if recorded != actual:
+                    found[prediction["_id"]] = (prediction.get("bet_count", 0), actual)
+            return found
+
+        suspects = await mismatches({"resolved": False, "expiry_time": {"$ne": None}})
+        if not suspects:
+            return []
+        await asyncio.sleep(settle_delay)
+        confirmed = await mismatches({"_id": {"$in": list(suspects)}})
+
+        corrected = []
+        for prediction_id, (bet_count, actual) in confirmed.items():
+            if suspects[prediction_id] != (bet_count, actual):
+                continue
+            result = await self.predictions.update_one(
+                {"_id": prediction_id, "bet_count": bet_count},
+                {"$set": {
+                    "pools": actual,
+                    "bet_count": sum(pool["bettors"] for pool in actual.values())
+                }}
+            )
+            if result.modified_count:
+                corrected.append(prediction_id)
+        return corrected
+
+    async def resolve_prediction(self, user_id, prediction_id, option):
+        """Mark option index ``option`` as the outcome and queue settlement.
 
-    async def resolve_prediction(self, user_id, prediction_id, result):
+        The settlement record is written before the prediction is flipped to
+        resolved, so a crash in between is finished by ``resume_pending``.
+        """
+        check_option(option)
         prediction = await self.predictions.find_one(
-            {"_id": ObjectId(prediction_id), "creator_id": user_id, "resolved": False}
+            {
+                "_id": ObjectId(prediction_id),
+                "creator_id": user_id,
+                "resolved": False,
+                f"options.{option}": {"$exists": True}
+            },
+            {"options": {"$slice": [option, 1]}}
         )
         if not prediction:
             raise ValueError("Prediction not found or already resolved.")
-
-        await self.predictions.update_one(
-            {"_id": ObjectId(prediction_id)},
-            {"$set": {"resolved": True, "result": result}}
+        record = await self.settlement.begin(prediction["_id"], prediction["options"][0], option)
+        prediction = await self.mark_resolved(record)
+        if not prediction:
+            raise ValueError("Prediction not found or already resolved.")
+        return prediction
+
+    async def mark_resolved(self, record):
+        """Resolve a prediction as its settlement record says; None if already resolved.
+
+        Going by the record keeps the prediction and its payout in agreement
+        when two resolutions race.
+        """
+        prediction = await self.predictions.find_one_and_update(
+            {"_id": record["_id"], "resolved": False},
+            {
+                "$set": {"resolved": True, "result": record["result"], "result_option": record["option"]},
+                "$currentDate": {"resolved_at": True}
+            },
+            projection=PREDICTION_PROJECTION,
+            return_document=ReturnDocument.AFTER
         )
-        await self.distribute_rewards(prediction, result)
-
-    async def distribute_rewards(self, prediction, result):
-        bets = prediction["bets"]
-        total_pool = sum(bet["amount"] for bet in bets if bet["choice"] == result)
-        if total_pool == 0:
-            return  # No winners
-
-        winners = [bet for bet in bets if bet["choice"] == result]
-        sorted_winners = sorted(winners, key=lambda x: x["amount"], reverse=True)
-
-        for idx, winner in enumerate(sorted_winners):
-            reward = (winner["amount"] / total_pool) * total_pool
-            await self.users.update_one(
-                {"user_id": winner["user_id"]},
-                {"$inc": {"balance": reward}}
-            )
-
+        self.deadlines.discard(record["_id"])
+        self.bet_predictions.pop(record["_id"])
+        return prediction
 
     async def add_kol(self, user_id):
         result = await self.users.update_one(
             {"user_id": user_id},
             {"$set": {"is_kol": True}}
         )
+        self._invalidate_user(user_id)
         return result.modified_count > 0
 
     async def add_admin(self, user_id):
@@ -148,14 +586,15 @@ class Database:
             {"user_id": user_id},
             {"$set": {"is_admin": True}}
         )
+        self._invalidate_user(user_id)
         return result.modified_count > 0
 
     async def is_kol(self, user_id):
-        user = await self.users.find_one({"user_id": user_id})
+        user = await self.get_user(user_id)
         return user and user.get("is_kol", False)
 
     async def is_admin(self, user_id):
-        user = await self.users.find_one({"user_id": user_id})
+        user = await self.get_user(user_id)
         return user and user.get("is_admin", False)
 
     async def is_bot_owner(self, user_id):
@@ -165,21 +604,26 @@ class Database:
         if user_id == referrer_id:
             raise ValueError("Cannot refer yourself")
         
-        user = await self.users.find_one({"user_id": user_id})
+        user = await self.get_user(user_id)
         if user and not user.get("referred_by"):
             await self.users.update_one(
                 {"user_id": user_id},
                 {"$set": {"referred_by": referrer_id}}
             )
-            await self.users.update_one(
+            self._invalidate_user(user_id, referrer_id)
+            referrer = await self.users.find_one_and_update(
                 {"user_id": referrer_id},
-                {"$inc": {"referrals": 1, "points": 10}}  # Bonus points for referral
+                {"$inc": {"referrals": 1, "points": 10}},  # Bonus points for referral
+                projection={"points": 1},
+                return_document=ReturnDocument.AFTER
             )
+            if referrer:
+                self._points_changed(referrer_id, referrer["points"])
             return True
         return False
 
     async def get_referral_info(self, user_id):
-        user = await self.users.find_one({"user_id": user_id})
+        user = await self.get_user(user_id)
         if not user:
             return None
         referral_count = user.get("referrals", 0)
@@ -191,7 +635,7 @@ class Database:
         }
 
     async def get_user_timezone(self, user_id):
-        user = await self.users.find_one({"user_id": user_id})
+        user = await self.get_user(user_id)
         return user.get("timezone", "UTC") if user else "UTC"
 
     async def set_user_timezone(self, user_id, tz_name):
@@ -203,36 +647,38 @@ class Database:
                 {"$set": {"timezone": tz_name}},
                 upsert=True
             )
+            self._invalidate_user(user_id)
             return True
         except UnknownTimeZoneError:
             return False
 
-    async def get_leaderboard(self):
-        # Get all users sorted by points in descending order
-        users = await self.users.find({}).sort("points", -1).to_list(length=None)
-        
-        # Create leaderboard data
-        leaderboard = []
-        for idx, user in enumerate(users, 1):
-            leaderboard.append({
-                "rank": idx,
-                "user_id": user["user_id"],
-                "points": user["points"]
-            })
-        return leaderboard
+    async def get_leaderboard(self, limit=None):
+        # Served from the materialized top-N snapshot
+        return await self.leaderboard.get(limit)
 
     async def get_user_rank(self, user_id):
-        leaderboard = await self.get_leaderboard()
-        for entry in leaderboard:
-            if entry["user_id"] == user_id:
-                return entry
-        return None
+        if self.ranks.loaded:
+            rank = self.ranks.rank(user_id)
+            if rank is not None:
+                return {"rank": rank, "user_id": user_id, "points": self.ranks.points[user_id]}
+
+        user = await self.get_user(user_id)
+        if not user:
+            return None
+        points = user.get("points", 0)
+        # Users ahead: more points, or equal points and a lower user_id
+        ahead = await self.users.count_documents({"$or": [
+            {"points": {"$gt": points}},
+            {"points": points, "user_id": {"$lt": user_id}}
+        ]})
+        return {"rank": ahead + 1, "user_id": user_id, "points": points}
 
     async def has_user_bet(self, user_id, prediction_id):
-        prediction = await self.predictions.find_one({"_id": ObjectId(prediction_id)})
-        if not prediction:
-            return False
-        return any(bet["user_id"] == user_id for bet in prediction.get("bets", []))
+        bet = await self.bets.find_one(
+            {"prediction_id": ObjectId(prediction_id), "user_id": user_id},
+            {"_id": 1}
+        )
+        return bet is not None
 
     async def update_user_balance(self, user_id: int, amount: int):
         """Add or subtract tokens from user balance"""
@@ -241,4 +687,5 @@ class Database:
             {"$inc": {"balance": amount}},
             upsert=True
         )
+        self._invalidate_user(user_id)
 
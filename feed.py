@@ -0,0 +1,108 @@
+import asyncio
+import time
+from datetime import datetime
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from cache import TTLCache
+from callbacks import encode_bet, encode_page
+from misc import from_utc
+from pools import option_pools, multiplier
+
+def option_keyboard(prediction, encode):
+    """One button per outcome, two to a row, with callbacks from ``encode(id, index)``."""
+    buttons = [
+        InlineKeyboardButton(text=label, callback_data=encode(prediction['_id'], option))
+        for option, label in enumerate(prediction['options'])
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+
+def bet_keyboard(prediction):
+    return option_keyboard(prediction, encode_bet)
+
+
+def pool_line(label, pools, option, fee_bps=0):
+    amount, bettors = pools[option]
+    if not bettors:
+        return f"{label}: no bets yet\n"
+    return f"{label}: {amount} tokens from {bettors} bettors, pays x{multiplier(pools, option, fee_bps):.2f}\n"
+
+
+class FeedEntry:
+    def __init__(self, prediction):
+        self.prediction = prediction
+        self.expiry_time = prediction['expiry_time']
+        self.keyboard = bet_keyboard(prediction)
+        self.text = (
+            f"Prediction: {prediction['question']}\n"
+            f"Options: {' vs '.join(prediction['options'])}\n"
+        )
+
+    def page_keyboard(self, has_prev, has_next):
+        """Bet buttons plus the browser's previous/next row."""
+        nav = []
+        if has_prev:
+            nav.append(InlineKeyboardButton(
+                text="◀️ Previous", callback_data=encode_page(self.prediction, forward=False)
+            ))
+        if has_next:
+            nav.append(InlineKeyboardButton(
+                text="Next ▶️", callback_data=encode_page(self.prediction, forward=True)
+            ))
+        rows = list(self.keyboard.inline_keyboard)
+        if nav:
+            rows.append(nav)
+        return InlineKeyboardMarkup(inline_keyboard=rows)
+
+    def render(self, user_tz, pools=None, fee_bps=0):
+        """The card in ``user_tz``; pass ``pools`` fresher than the cached prediction's."""
+        labels = self.prediction['options']
+        pools = option_pools({"pools": pools} if pools is not None else self.prediction, len(labels))
+        local_time = from_utc(self.expiry_time, user_tz)
+        return (
+            self.text
+            + "".join(pool_line(label, pools, option, fee_bps) for option, label in enumerate(labels))
+            + f"Bids close: {local_time:%Y-%m-%d %H:%M} {local_time.tzname()}"
+        )
+
+
+class PredictionFeed:
+    """Shared in-memory view of the active predictions.
+
+    Cards and keyboards are built once per reload; serving ``/predict`` only
+    adds the pools and formats the deadline in the caller's timezone. The
+    feed reloads when invalidated (prediction created, resolved or closed)
+    or after ``max_age`` seconds, and drops expired entries on read without
+    a query. Pools are cached separately for ``pools_ttl`` seconds, about as
+    long as the pool counters take to catch up with bets anyway.
+    """
+
+    def __init__(self, db, max_age=30, pools_ttl=1):
+        self.db = db
+        self.max_age = max_age
+        self.pool_cache = TTLCache(maxsize=1000, ttl=pools_ttl)
+        self.entries = []
+        self.loaded_at = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    def _is_fresh(self):
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.max_age
+
+    async def get(self):
+        if not self._is_fresh():
+            async with self._lock:
+                if not self._is_fresh():
+                    predictions = await self.db.get_active_predictions()
+                    self.entries = [FeedEntry(prediction) for prediction in predictions]
+                    self.loaded_at = time.monotonic()
+        now = datetime.utcnow()
+        return [entry for entry in self.entries if entry.expiry_time > now]
+
+    async def pools(self, prediction_id):
+        pools = self.pool_cache.get(prediction_id)
+        if pools is None:
+            pools = await self.db.get_prediction_pools(prediction_id)
+            self.pool_cache.set(prediction_id, pools)
+        return pools
@@ -0,0 +1,163 @@
+import asyncio
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from pools import pool_inc
+
+
+class BetBuffer:
+    """Coalesces bets on the same prediction into one write per batch.
+
+    A bet is checked against the briefly cached copy of the prediction that
+    ``Database.bet_choice`` keeps, and the stake is reserved straight away
+    with a conditional debit on the user's own document. The bet then waits up to ``window`` seconds, or
+    until ``max_batch`` bets have gathered for that prediction. Each group is
+    flushed as one conditional ``$inc`` of the prediction's bet count and
+    per-option pools, plus one unordered ``insert_many``. Callers are only
+    answered once their batch has been written, and any bet that did not
+    land is refunded.
+    """
+
+    def __init__(self, db, window=0.005, max_batch=500):
+        self.db = db
+        self.window = window
+        self.max_batch = max_batch
+        self._groups = {}
+        self._flush_handle = None
+        self.batches = 0
+
+    async def place(self, user_id, prediction_id, option, amount):
+        """Reserve the stake, queue the bet and wait for its batch; returns the choice."""
+        choice = await self.db.bet_choice(prediction_id, option)
+
+        if user_id in self._groups.get(prediction_id, ()):
+            raise ValueError("You have already placed a bet on this prediction!")
+        debited = await self.db.users.update_one(
+            {"user_id": user_id, "balance": {"$gte": amount}},
+            {"$inc": {"balance": -amount}}
+        )
+        if not debited.modified_count:
+            raise ValueError("Insufficient balance.")
+
+        # The group may have been flushed, or joined by the same user, while the debit was in flight
+        group = self._groups.setdefault(prediction_id, {})
+        if user_id in group:
+            await self._refund([{"user_id": user_id, "amount": amount}])
+            raise ValueError("You have already placed a bet on this prediction!")
+        future = asyncio.get_running_loop().create_future()
+        group[user_id] = ({
+            "prediction_id": prediction_id,
+            "user_id": user_id,
+            "choice": choice,
+            "option": option,
+            "amount": amount,
+            "created_at": datetime.utcnow()
+        }, future)
+        if len(group) == self.max_batch:
+            asyncio.ensure_future(self._flush_group(prediction_id))
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.window, lambda: asyncio.ensure_future(self.flush())
+            )
+        return await future
+
+    async def flush(self):
+        self._flush_handle = None
+        await asyncio.gather(*(self._flush_group(prediction_id) for prediction_id in list(self._groups)))
+
+    async def _flush_group(self, prediction_id):
+        group = self._groups.pop(prediction_id, None)
+        if not group:
+            return
+        self.batches += 1
+        bets = [bet for bet, _ in group.values()]
+        progress = {"counted": False}
+        try:
+            rejected = await self._write(prediction_id, bets, progress)
+        except Exception as e:
+            print(f"Error flushing bets on prediction {prediction_id}: {e}")
+            try:
+                rejected = await self._recover(prediction_id, bets, progress["counted"])
+            except Exception as e:
+                print(
+                    f"Error recovering bets on prediction {prediction_id}, stakes still reserved: "
+                    f"{[(bet['user_id'], bet['amount']) for bet in bets]}: {e}"
+                )
+                rejected = {bet["user_id"]: ValueError("Could not record bet.") for bet in bets}
+
+        for user_id, (bet, future) in group.items():
+            if future.done():
+                continue
+            if user_id in rejected:
+                future.set_exception(rejected[user_id])
+            else:
+                future.set_result(bet["choice"])
+
+    async def _write(self, prediction_id, bets, progress):
+        """Write one batch; returns ``{user_id: error}`` for bets that were refunded."""
+        opened = await self.db.predictions.update_one(
+            {"_id": prediction_id, "resolved": False, "expiry_time": {"$gt": datetime.utcnow()}},
+            {"$inc": {"bet_count": len(bets), **self._pool_totals(bets)}}
+        )
+        if not opened.modified_count:
+            self.db.bet_predictions.pop(prediction_id)
+            error = ValueError(await self.db._bet_rejection_reason(prediction_id))
+            await self._refund(bets)
+            return {bet["user_id"]: error for bet in bets}
+        progress["counted"] = True
+
+        failed = {}
+        try:
+            await self.db.bets.insert_many(bets, ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details["writeErrors"]:
+                bet = bets[write_error["index"]]
+                failed[bet["user_id"]] = (
+                    ValueError("You have already placed a bet on this prediction!")
+                    if write_error["code"] == 11000 else ValueError("Could not record bet.")
+                )
+        if failed:
+            await self._release([bet for bet in bets if bet["user_id"] in failed], prediction_id)
+        return failed
+
+    async def _recover(self, prediction_id, bets, counted):
+        """After a failed write, keep the bets that reached the server and refund the rest.
+
+        The counters are only reversed when their ``$inc`` is known to have
+        applied; otherwise pool reconciliation settles them.
+        """
+        landed = set(await self.db.bets.distinct(
+            "user_id",
+            {"prediction_id": prediction_id, "user_id": {"$in": [bet["user_id"] for bet in bets]}}
+        ))
+        lost = [bet for bet in bets if bet["user_id"] not in landed]
+        if lost:
+            await self._release(lost, prediction_id if counted else None)
+        return {bet["user_id"]: ValueError("Could not record bet.") for bet in lost}
+
+    async def _release(self, bets, prediction_id=None):
+        """Refund ``bets`` and, given ``prediction_id``, take them back out of its counters."""
+        await self._refund(bets)
+        if prediction_id is not None:
+            await self.db.predictions.update_one(
+                {"_id": prediction_id},
+                {"$inc": {"bet_count": -len(bets), **self._pool_totals(bets, sign=-1)}}
+            )
+
+    def _pool_totals(self, bets, sign=1):
+        increments = {}
+        for bet in bets:
+            for field, value in pool_inc(bet["option"], bet["amount"]).items():
+                increments[field] = increments.get(field, 0) + sign * value
+        return increments
+
+    async def _refund(self, bets):
+        await self.db.users.bulk_write([
+            UpdateOne({"user_id": bet["user_id"]}, {"$inc": {"balance": bet["amount"]}})
+            for bet in bets
+        ], ordered=False)
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        await self.flush()
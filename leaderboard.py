@@ -0,0 +1,151 @@
+import asyncio
+import time
+from datetime import datetime
+from pymongo import DESCENDING, ASCENDING
+from sortedcontainers import SortedList
+
+SNAPSHOT_ID = "top"
+
+
+class Leaderboard:
+    """Materialized top-N leaderboard.
+
+    The snapshot is kept in memory and mirrored to a tiny Mongo collection so
+    other bot processes can reuse it. It is rebuilt from the users collection
+    when older than ``max_age`` seconds and patched in place when a user's
+    points change.
+    """
+
+    def __init__(self, users, snapshots, size=100, max_age=60):
+        self.users = users
+        self.snapshots = snapshots
+        self.size = size
+        self.max_age = max_age
+        self.entries = []
+        self.refreshed_at = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def is_fresh(self):
+        return not self._stale and time.monotonic() - self.refreshed_at < self.max_age
+
+    async def get(self, limit=None):
+        if not self.is_fresh():
+            async with self._lock:
+                if not self.is_fresh() and not await self._load():
+                    await self.refresh()
+        entries = self.entries if limit is None else self.entries[:limit]
+        return [dict(entry) for entry in entries]
+
+    async def _load(self):
+        # Reuse a snapshot written by another process if it is still fresh
+        snapshot = await self.snapshots.find_one({"_id": SNAPSHOT_ID})
+        if not snapshot or snapshot.get("size") != self.size:
+            return False
+        age = (datetime.utcnow() - snapshot["updated_at"]).total_seconds()
+        if age >= self.max_age:
+            return False
+        self.entries = snapshot["entries"]
+        self.refreshed_at = time.monotonic() - age
+        self._stale = False
+        return True
+
+    async def refresh(self):
+        cursor = self.users.find(
+            {}, {"_id": 0, "user_id": 1, "points": 1}
+        ).sort([("points", DESCENDING), ("user_id", ASCENDING)]).limit(self.size)
+        users = await cursor.to_list(length=self.size)
+        self.entries = [
+            {"rank": idx, "user_id": user["user_id"], "points": user.get("points", 0)}
+            for idx, user in enumerate(users, 1)
+        ]
+        self.refreshed_at = time.monotonic()
+        self._stale = False
+        await self.snapshots.update_one(
+            {"_id": SNAPSHOT_ID},
+            {"$set": {
+                "entries": self.entries,
+                "size": self.size,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+
+    def record(self, user_id, points):
+        """Apply a points change to the in-memory snapshot."""
+        if self._stale:
+            return
+        entries = [e for e in self.entries if e["user_id"] != user_id]
+        was_ranked = len(entries) != len(self.entries)
+        full = len(self.entries) >= self.size
+        if not was_ranked and full and (points, -user_id) <= self._key(self.entries[-1]):
+            return  # Not good enough to enter the top N
+        if was_ranked and full and points < self.entries[-1]["points"]:
+            # Dropped to the bottom edge; someone outside may now outrank them
+            self._stale = True
+            return
+        entries.append({"user_id": user_id, "points": points})
+        entries.sort(key=self._key, reverse=True)
+        self.entries = [
+            {"rank": idx, "user_id": e["user_id"], "points": e["points"]}
+            for idx, e in enumerate(entries[:self.size], 1)
+        ]
+
+    def invalidate(self):
+        self._stale = True
+
+    async def run(self, interval=None):
+        """Periodically rebuild the snapshot in the background."""
+        interval = interval or self.max_age
+        while True:
+            try:
+                async with self._lock:
+                    await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing leaderboard: {e}")
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def _key(entry):
+        return (entry["points"], -entry["user_id"])
+
+
+class RankIndex:
+    """In-process sorted index of (points, user_id) for O(log n) rank lookups.
+
+    Ordering matches the leaderboard: points descending, ties broken by the
+    lower user_id. Loaded once from the users collection and kept in sync by
+    the Database methods that change points.
+    """
+
+    def __init__(self):
+        self.keys = SortedList()
+        self.points = {}
+        self.loaded = False
+
+    async def load(self, users):
+        keys, points = [], {}
+        cursor = users.find({}, {"_id": 0, "user_id": 1, "points": 1})
+        async for user in cursor:
+            user_points = user.get("points", 0)
+            points[user["user_id"]] = user_points
+            keys.append((-user_points, user["user_id"]))
+        self.keys = SortedList(keys)
+        self.points = points
+        self.loaded = True
+
+    def update(self, user_id, points):
+        old = self.points.get(user_id)
+        if old is not None:
+            self.keys.remove((-old, user_id))
+        self.points[user_id] = points
+        self.keys.add((-points, user_id))
+
+    def rank(self, user_id):
+        points = self.points.get(user_id)
+        if points is None:
+            return None
+        return self.keys.bisect_left((-points, user_id)) + 1
+
+    def __len__(self):
+        return len(self.points)
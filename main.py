@@ -6,12 +6,25 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from datetime import datetime
-from misc import broadcast_notifications, resolve_bets, convert_to_timezone, to_utc, from_utc, resolve_single_prediction
-from db import Database
+from misc import broadcast_notifications, convert_to_timezone, to_utc, settlement_messages
+from db import Database, MIN_OPTIONS, MAX_OPTIONS
+from names import DisplayNames
+from middlewares import DisplayNameMiddleware, ThrottlingMiddleware, parse_limits
+from broadcast import Broadcaster
+from outbox import Outbox
+from storage import MongoFSMStorage, FSMReleaseMiddleware
+from webhook import WebhookServer
+from sharding import Supervisor
+from feed import PredictionFeed, FeedEntry, option_keyboard
+from metrics import MetricsServer, MongoCommandListener, instrument
+from callbacks import (
+    CallbackKind, BET, RESOLVE, TZ, PAGE, TIMEZONES, TZ_CUSTOM,
+    encode_resolve, encode_tz
+)
+from pymongo import ASCENDING, DESCENDING
 from dotenv import load_dotenv
 import os
 from functools import wraps
-from aiogram.exceptions import TelegramBadRequest
 import logging
 
 # Load environment variables
@@ -26,19 +39,63 @@ BOT_OWNER_ID = int(os.getenv("BOT_OWNER_ID"))
 # Optional configurations
 MAX_BET = int(os.getenv("MAX_BET_AMOUNT", 100))
 MIN_BET = int(os.getenv("MIN_BET_AMOUNT", 10))
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", 1))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 100))
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
 
 # Initialize bot and dispatcher
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
-db = Database(MONGO_URI, DB_NAME)
+db = Database(MONGO_URI, DB_NAME, event_listeners=[MongoCommandListener()])
+if os.getenv("FSM_STORAGE", "mongo") == "memory":
+    storage = MemoryStorage()
+else:
+    storage = MongoFSMStorage(
+        db.db["fsm"],
+        ttl=int(os.getenv("FSM_TTL", 86400)),
+        cache_ttl=int(os.getenv("FSM_CACHE_TTL", 2))
+    )
+dp = Dispatcher(storage=storage)
+instrument(dp, bot)
+names = DisplayNames(
+    db, bot,
+    maxsize=int(os.getenv("NAME_CACHE_SIZE", 10000)),
+    ttl=int(os.getenv("NAME_CACHE_TTL", 3600))
+)
+dp.update.outer_middleware(DisplayNameMiddleware(names))
+if isinstance(storage, MongoFSMStorage):
+    # Another process may take this chat's next update, so state must not linger here
+    dp.update.outer_middleware(FSMReleaseMiddleware(storage))
+throttling = ThrottlingMiddleware(
+    limits=parse_limits(os.getenv("THROTTLE_LIMITS")),
+    debounce=float(os.getenv("DEBOUNCE_WINDOW", 1.0))
+)
+dp.callback_query.outer_middleware(throttling)
+broadcaster = Broadcaster(
+    bot,
+    workers=int(os.getenv("BROADCAST_WORKERS", 20)),
+    rate=float(os.getenv("BROADCAST_RATE", 30))
+)
+outbox = Outbox(db, broadcaster, batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", 100)))
+
+async def enqueue_settlement_notifications(resolved_data):
+    await outbox.enqueue(
+        settlement_messages(resolved_data),
+        key_prefix=f"settle:{resolved_data['prediction_id']}"
+    )
+
+db.settlement.on_settled = enqueue_settlement_notifications
+feed = PredictionFeed(
+    db,
+    max_age=int(os.getenv("FEED_MAX_AGE", 30)),
+    pools_ttl=float(os.getenv("POOL_FLUSH_INTERVAL", 1))
+)
 
 # Define states
 class PredictionStates(StatesGroup):
     awaiting_timezone = State()
     awaiting_wallet_address = State()
     awaiting_prediction_question = State()
-    awaiting_option_one = State()
-    awaiting_option_two = State()
+    awaiting_options = State()
     awaiting_deadline = State()
     awaiting_bet_amount = State()
     awaiting_kol_id = State()
@@ -52,33 +109,7 @@ async def help_button_handler(callback_query: types.CallbackQuery):
 
 @dp.callback_query(F.data == "predict")
 async def predict_button_handler(callback_query: types.CallbackQuery):
-    user_id = callback_query.from_user.id
-    predictions = await db.get_active_predictions()
-    if not predictions:
-        await callback_query.message.answer("No active predictions available.")
-        return
-    
-    user_tz = await db.get_user_timezone(user_id)
-    for prediction in predictions:
-        local_time = from_utc(prediction['expiry_time'], user_tz)
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text=prediction['options']['option1'], 
-                    callback_data=f"bet_{prediction['options']['option1']}_{prediction['_id']}"
-                ),
-                InlineKeyboardButton(
-                    text=prediction['options']['option2'], 
-                    callback_data=f"bet_{prediction['options']['option2']}_{prediction['_id']}"
-                )
-            ]
-        ])
-        await callback_query.message.answer(
-            f"Prediction: {prediction['question']}\n"
-            f"Options: {prediction['options']['option1']} vs {prediction['options']['option2']}\n"
-            f"Bids close: {local_time:%Y-%m-%d %H:%M} {local_time.tzname()}",
-            reply_markup=keyboard
-        )
+    await send_active_predictions(callback_query.message, callback_query.from_user.id)
     await callback_query.answer()
 
 @dp.callback_query(lambda c: c.data == "refer")
@@ -131,13 +162,7 @@ async def start_handler(message: types.Message, state: FSMContext):
     user_tz = await db.get_user_timezone(user_id)
     if not user_tz:
         await state.set_state(PredictionStates.awaiting_timezone)
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Asia/Dubai", callback_data="tz_Asia/Dubai")],
-            [InlineKeyboardButton(text="Europe/London", callback_data="tz_Europe/London")],
-            [InlineKeyboardButton(text="America/New_York", callback_data="tz_America/New_York")],
-            [InlineKeyboardButton(text="Custom Timezone", callback_data="tz_custom")]
-        ])
-        await message.answer("Please select your timezone:", reply_markup=keyboard)
+        await message.answer("Please select your timezone:", reply_markup=timezone_keyboard())
         return
     
     # Show main menu if timezone is set
@@ -203,40 +228,67 @@ async def balance_handler(message: types.Message):
     points = await db.get_user_points(user_id)
     await message.answer(f"Your balance:\nTokens: {balance}\nPoints: {points}")
 
-# Automatic resolution function
-async def automatic_resolution():
-    await resolve_bets(bot, db)
+def resolve_keyboard(prediction):
+    return option_keyboard(prediction, encode_resolve)
+
+# Called by the deadline scheduler the moment a prediction expires
+async def close_expired_prediction(prediction_id):
+    prediction = await db.close_prediction(prediction_id)
+    if not prediction:
+        return
+    feed.invalidate()
+    try:
+        await bot.send_message(
+            prediction['creator_id'],
+            f"⏰ Betting has closed on: {prediction['question']}\n"
+            "Pick the winning option to pay out the bets:",
+            reply_markup=resolve_keyboard(prediction)
+        )
+    except Exception as e:
+        print(f"Failed to notify creator of prediction {prediction_id}: {e}")
+
+db.deadlines.on_deadline = close_expired_prediction
 
 # Add prediction handlers
 @dp.message(Command("predict"))
 async def predict_handler(message: types.Message):
-    user_id = message.from_user.id
-    predictions = await db.get_active_predictions()
-    if not predictions:
+    await send_active_predictions(message, message.from_user.id)
+
+async def send_active_predictions(message: types.Message, user_id: int):
+    entries = await feed.get()
+    if not entries:
         await message.answer("No active predictions available.")
         return
     
+    # One browsable message; the first card and its odds come from the feed
     user_tz = await db.get_user_timezone(user_id)
-    for prediction in predictions:
-        local_time = from_utc(prediction['expiry_time'], user_tz)
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text=prediction['options']['option1'], 
-                    callback_data=f"bet_{prediction['options']['option1']}_{prediction['_id']}"
-                ),
-                InlineKeyboardButton(
-                    text=prediction['options']['option2'], 
-                    callback_data=f"bet_{prediction['options']['option2']}_{prediction['_id']}"
-                )
-            ]
-        ])
-        await message.answer(
-            f"Prediction: {prediction['question']}\n"
-            f"Options: {prediction['options']['option1']} vs {prediction['options']['option2']}\n"
-            f"Bids close: {local_time:%Y-%m-%d %H:%M} {local_time.tzname()}",
-            reply_markup=keyboard
+    entry = entries[0]
+    pools = await feed.pools(entry.prediction['_id'])
+    await message.answer(
+        entry.render(user_tz, pools, db.settlement.fee_bps),
+        reply_markup=entry.page_keyboard(has_prev=False, has_next=len(entries) > 1)
+    )
+
+@dp.callback_query(CallbackKind(PAGE))
+async def predictions_page_handler(callback_query: types.CallbackQuery, cb):
+    forward = bool(cb.option)
+    predictions, has_more = await db.get_active_predictions_page(
+        (cb.expiry_time, cb.prediction_id), direction=ASCENDING if forward else DESCENDING
+    )
+    if not predictions:
+        await callback_query.answer("No more predictions.")
+        return
+    
+    entry = FeedEntry(predictions[0])
+    user_tz = await db.get_user_timezone(callback_query.from_user.id)
+    await callback_query.message.edit_text(
+        entry.render(user_tz, fee_bps=db.settlement.fee_bps),
+        reply_markup=entry.page_keyboard(
+            has_prev=has_more if not forward else True,
+            has_next=has_more if forward else True
         )
+    )
+    await callback_query.answer()
 
 @dp.message(Command("create"))
 async def create_handler(message: types.Message, state: FSMContext):
@@ -258,40 +310,47 @@ async def prediction_question_handler(message: types.Message, state: FSMContext)
     question = message.text
     user_id = message.from_user.id
     await db.add_prediction_draft(user_id, question)
-    await state.set_state(PredictionStates.awaiting_option_one)
+    await state.set_state(PredictionStates.awaiting_options)
     await message.answer(
-        "Please enter the first option for your prediction:\n\n"
+        f"Send the possible outcomes one message at a time ({MIN_OPTIONS} to {MAX_OPTIONS}).\n"
+        "Please enter the first outcome:\n\n"
         "Use /cancel to abort this operation."
     )
 
-@dp.message(PredictionStates.awaiting_option_one)
-async def option_one_handler(message: types.Message, state: FSMContext):
-    if message.text.startswith('/'):
-        return
-        
-    await state.update_data(option1=message.text)
-    await state.set_state(PredictionStates.awaiting_option_two)
+async def ask_for_deadline(message: types.Message, state: FSMContext):
+    await state.set_state(PredictionStates.awaiting_deadline)
     await message.answer(
-        "Please enter the second option for your prediction:\n\n"
+        "Please specify the deadline (YYYY-MM-DD HH:MM format):\n\n"
         "Use /cancel to abort this operation."
     )
 
-@dp.message(PredictionStates.awaiting_option_two)
-async def option_two_handler(message: types.Message, state: FSMContext):
+@dp.message(PredictionStates.awaiting_options, Command("done"))
+async def options_done_handler(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    if data.get('option_count', 0) < MIN_OPTIONS:
+        await message.answer(f"A prediction needs at least {MIN_OPTIONS} outcomes. Please enter another one.")
+        return
+    await ask_for_deadline(message, state)
+
+@dp.message(PredictionStates.awaiting_options)
+async def option_handler(message: types.Message, state: FSMContext):
     if message.text.startswith('/'):
         return
-        
-    data = await state.get_data()
-    option1 = data['option1']
-    option2 = message.text
-    
-    # Updates draft with options
-    await db.update_prediction_options(message.from_user.id, option1, option2)
-    await state.set_state(PredictionStates.awaiting_deadline)
-    await message.answer(
-        "Please specify the deadline (YYYY-MM-DD HH:MM format):\n\n"
-        "Use /cancel to abort this operation."
-    )
+
+    # Appends to the draft; outcomes keep the index they were entered with
+    count = await db.add_prediction_option(message.from_user.id, message.text)
+    if count is None:
+        await message.answer("Could not add that outcome. Use /cancel and start again.")
+        return
+    await state.update_data(option_count=count)
+    if count >= MAX_OPTIONS:
+        await ask_for_deadline(message, state)
+    elif count < MIN_OPTIONS:
+        await message.answer("Please enter the next outcome:")
+    else:
+        await message.answer(
+            f"Outcome {count} added. Send another outcome, or /done to finish."
+        )
 
 @dp.message(PredictionStates.awaiting_deadline)
 async def prediction_deadline_handler(message: types.Message, state: FSMContext):
@@ -317,6 +376,7 @@ async def prediction_deadline_handler(message: types.Message, state: FSMContext)
             
         # Finalize prediction and deduct tokens
         await db.finalize_prediction(user_id, utc_deadline)
+        feed.invalidate()
         await db.update_user_balance(user_id, -80)  # Deduct 80 tokens
         
         await message.answer(
@@ -339,37 +399,25 @@ async def resolve_handler(message: types.Message):
         return
     
     for prediction in predictions:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text=prediction['options']['option1'],
-                    callback_data=f"resolve_{prediction['options']['option1']}_{prediction['_id']}"
-                ),
-                InlineKeyboardButton(
-                    text=prediction['options']['option2'],
-                    callback_data=f"resolve_{prediction['options']['option2']}_{prediction['_id']}"
-                )
-            ]
-        ])
+        keyboard = resolve_keyboard(prediction)
         await message.answer(
             f"Resolve Prediction: {prediction['question']}\n"
-            f"Options: {prediction['options']['option1']} vs {prediction['options']['option2']}",
+            f"Options: {' vs '.join(prediction['options'])}",
             reply_markup=keyboard
         )
 
 # Callback handlers
-@dp.callback_query(F.data.startswith("bet_"))
-async def bet_handler(callback_query: types.CallbackQuery, state: FSMContext):
+@dp.callback_query(CallbackKind(BET))
+async def bet_handler(callback_query: types.CallbackQuery, state: FSMContext, cb):
     user_id = callback_query.from_user.id
-    data = callback_query.data.split("_")
-    prediction_id, choice = data[2], data[1]
+    prediction_id, option = cb.prediction_id, cb.option
     
     # Check if user has already bet
     if await db.has_user_bet(user_id, prediction_id):
         await callback_query.answer("You have already placed a bet on this prediction!", show_alert=True)
         return
     
-    await state.update_data(prediction_id=prediction_id, choice=choice)
+    await state.update_data(prediction_id=str(prediction_id), option=option)
     await state.set_state(PredictionStates.awaiting_bet_amount)
     await callback_query.message.answer(
         "Choose your bet amount (10 to 100):\n\n"
@@ -383,50 +431,34 @@ async def bet_amount_handler(message: types.Message, state: FSMContext):
         amount = int(message.text)
         if amount < 10 or amount > 100:
             raise ValueError
-        
-        data = await state.get_data()
-        prediction_id = data['prediction_id']
-        choice = data['choice']
-        
-        user_id = message.from_user.id
-        await db.place_bet(user_id, prediction_id, choice, amount)
-        await message.answer(f"Bet placed successfully! You bet {amount} tokens on {choice.upper()}.")
-        await state.clear()
     except ValueError:
         await message.answer("Invalid amount. Please enter a value between 10 and 100.")
+        return
+        
+    data = await state.get_data()
+    prediction_id = data['prediction_id']
+    option = data['option']
+    
+    user_id = message.from_user.id
+    try:
+        choice = await db.place_bet(user_id, prediction_id, option, amount)
+        await message.answer(f"Bet placed successfully! You bet {amount} tokens on {choice.upper()}.")
+    except ValueError as e:
+        await message.answer(f"Could not place bet: {e}")
+    await state.clear()
 
-@dp.callback_query(F.data.startswith("resolve_"))
-async def resolve_prediction_handler(callback_query: types.CallbackQuery):
-    data = callback_query.data.split("_")
-    prediction_id, result = data[2], data[1]
+@dp.callback_query(CallbackKind(RESOLVE))
+async def resolve_prediction_handler(callback_query: types.CallbackQuery, cb):
     user_id = callback_query.from_user.id
     
     try:
-        prediction = await db.resolve_prediction(user_id, prediction_id, result)
-        resolved_data = await resolve_single_prediction(prediction, db)
-        
-        # Create personalized messages for participants
-        for participant_id in resolved_data['user_ids']:
-            # Find if user was winner or loser
-            winner_info = next((w for w in resolved_data['winners'] if w['user_id'] == participant_id), None)
-            loser_info = next((l for l in resolved_data['losers'] if l['user_id'] == participant_id), None)
-            
-            message = f"Prediction '{prediction['question']}' has been resolved!\n"
-            message += f"Winning choice: {resolved_data['winning_choice']}\n\n"
-            
-            if winner_info:
-                message += f"🎉 Congratulations! You won {winner_info['reward']:.2f} tokens!\n"
-                message += f"Your bet: {winner_info['bet_amount']} tokens"
-            elif loser_info:
-                message += f"😔 Unfortunately, you lost {loser_info['lost_amount']} tokens.\n"
-                message += f"Your bet: {loser_info['bet_amount']} tokens"
-            
-            try:
-                await bot.send_message(participant_id, message)
-            except Exception as e:
-                print(f"Failed to notify user {participant_id}: {e}")
-        
-        await callback_query.message.answer("Prediction resolved and participants notified!")
+        prediction = await db.resolve_prediction(user_id, cb.prediction_id, cb.option)
+        feed.invalidate()
+        # Payouts and notifications continue in the background and survive restarts
+        db.settlement.settle_in_background(prediction, prediction['result'])
+        await callback_query.message.answer(
+            "Prediction resolved! Rewards are being paid out and participants will be notified shortly."
+        )
     except ValueError as e:
         await callback_query.message.answer(f"Error resolving prediction: {e}")
     
@@ -522,25 +554,27 @@ async def kol_id_handler(message: types.Message, state: FSMContext):
     finally:
         await state.clear()
 
+def timezone_keyboard():
+    rows = [
+        [InlineKeyboardButton(text=tz_name, callback_data=encode_tz(index))]
+        for index, tz_name in enumerate(TIMEZONES)
+    ]
+    rows.append([InlineKeyboardButton(text="Custom Timezone", callback_data=encode_tz(TZ_CUSTOM))])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
 @dp.message(Command("timezone"))
 async def timezone_command(message: types.Message):
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Asia/Dubai", callback_data="tz_Asia/Dubai")],
-        [InlineKeyboardButton(text="Europe/London", callback_data="tz_Europe/London")],
-        [InlineKeyboardButton(text="America/New_York", callback_data="tz_America/New_York")],
-        [InlineKeyboardButton(text="Custom Timezone", callback_data="tz_custom")]
-    ])
-    await message.answer("Please select your timezone:", reply_markup=keyboard)
+    await message.answer("Please select your timezone:", reply_markup=timezone_keyboard())
 
-@dp.callback_query(F.data.startswith("tz_"))
-async def timezone_callback(callback_query: types.CallbackQuery, state: FSMContext):
-    tz_name = callback_query.data[3:]
-    if tz_name == "custom":
+@dp.callback_query(CallbackKind(TZ))
+async def timezone_callback(callback_query: types.CallbackQuery, state: FSMContext, cb):
+    if cb.option == TZ_CUSTOM or cb.option >= len(TIMEZONES):
         await state.set_state(PredictionStates.awaiting_timezone)
         await callback_query.message.answer(
             "Please enter your timezone (e.g., Asia/Kolkata, Europe/Paris)"
         )
     else:
+        tz_name = TIMEZONES[cb.option]
         success = await db.set_user_timezone(callback_query.from_user.id, tz_name)
         if success:
             await callback_query.message.answer(f"Timezone set to {tz_name}")
@@ -582,20 +616,18 @@ async def get_user_roles(user_id: int):
 
 @dp.message(Command("leaderboard"))
 async def leaderboard_handler(message: types.Message):
-    leaderboard = await db.get_leaderboard()
+    leaderboard = await db.get_leaderboard(limit=5)
     user_rank = await db.get_user_rank(message.from_user.id)
     
-    text = "🏆 *Top 5 Users*\n\n"
+    display_names = await names.resolve([entry["user_id"] for entry in leaderboard])
     
-    # Get top 5 entries
-    top_5 = leaderboard[:5]
+    text = "🏆 *Top 5 Users*\n\n"
     
-    for entry in top_5:
-        try:
-            user = await bot.get_chat(entry["user_id"])
-            username = html.escape(user.username or user.first_name)
-            text += f"{entry['rank']}. {username}: {entry['points']} points\n"
-        except TelegramBadRequest:
+    for entry in leaderboard:
+        username = display_names.get(entry["user_id"])
+        if username:
+            text += f"{entry['rank']}. {html.escape(username)}: {entry['points']} points\n"
+        else:
             text += f"{entry['rank']}. User{entry['user_id']}: {entry['points']} points\n"
     
     if user_rank and user_rank["rank"] > 5:
@@ -604,6 +636,28 @@ async def leaderboard_handler(message: types.Message):
     
     await message.answer(text, parse_mode="HTML")
 
+# Registered last: stale or malformed buttons are rejected without touching the database
+@dp.callback_query()
+async def unknown_callback_handler(callback_query: types.CallbackQuery):
+    await callback_query.answer("This button is no longer valid.", show_alert=True)
+
+@dp.message(Command("stats"))
+async def stats_handler(message: types.Message):
+    if not await db.is_bot_owner(message.from_user.id):
+        await message.reply("⛔️ This command is only available to the bot owner.")
+        return
+
+    queue = await outbox.stats()
+    cache = db.cache_stats()
+    await message.answer(
+        "📈 Bot stats\n\n"
+        f"Outbox depth: {queue['depth']}\n"
+        f"Outbox drain rate: {queue['drain_rate']:.1f} msg/s\n"
+        f"Outbox by status: {queue['by_status']}\n"
+        f"User cache: {cache['hits']} hits, {cache['misses']} misses, {cache['size']} entries\n"
+        f"Throttled callbacks: {dict(throttling.throttled)}"
+    )
+
 @dp.message(Command("cancel"))
 async def cancel_handler(message: types.Message, state: FSMContext):
     current_state = await state.get_state()
@@ -614,8 +668,7 @@ async def cancel_handler(message: types.Message, state: FSMContext):
     # Check if we're in prediction creation flow
     if current_state in [
         PredictionStates.awaiting_prediction_question,
-        PredictionStates.awaiting_option_one,
-        PredictionStates.awaiting_option_two,
+        PredictionStates.awaiting_options,
         PredictionStates.awaiting_deadline
     ]:
         # Delete the draft prediction
@@ -624,14 +677,105 @@ async def cancel_handler(message: types.Message, state: FSMContext):
     await state.clear()
     await message.reply("Operation cancelled.")
 
+async def reconcile_pools_periodically(interval):
+    # The first pass runs at startup to repair increments a crashed process never flushed
+    while True:
+        try:
+            corrected = await db.reconcile_pools()
+            if corrected:
+                print(f"Corrected pool counters on {len(corrected)} predictions: {corrected}")
+        except Exception as e:
+            print(f"Error reconciling pools: {e}")
+        await asyncio.sleep(interval)
+
+async def start_metrics(offset=0):
+    # Each process has its own metrics; sharded workers listen on the ports after METRICS_PORT
+    if METRICS_PORT:
+        await MetricsServer().start(os.getenv("METRICS_HOST", "0.0.0.0"), METRICS_PORT + offset)
+
+async def on_startup(primary=True):
+    # With several worker processes only the primary runs one-off jobs
+    if primary:
+        await db.ensure_indexes()
+        await db.migrate_options()
+        # Settlement reads only the bets collection, so embedded bets must be moved first
+        await db.migrate_bets()
+        await db.archive.ensure_collection()
+        if os.getenv("DB_VERIFY_INDEXES", "0") == "1":
+            await db.verify_query_plans()
+        await outbox.ensure_indexes()
+        if isinstance(storage, MongoFSMStorage):
+            await storage.ensure_indexes()
+        # Keep the leaderboard snapshot warm
+        asyncio.create_task(db.leaderboard.run())
+        asyncio.create_task(reconcile_pools_periodically(int(os.getenv("POOL_RECONCILE_INTERVAL", 3600))))
+        asyncio.create_task(db.archive.run())
+    outbox.start(workers=int(os.getenv("OUTBOX_WORKERS", 2)))
+    # Every worker may resume settlements; the settlement lease keeps it to one runner each
+    asyncio.create_task(db.settlement.run())
+    await db.load_deadlines()
+    asyncio.create_task(db.deadlines.run())
+    await db.load_rank_index()
+
+@dp.shutdown()
+async def on_shutdown():
+    # Answer bets still waiting in the buffer instead of dropping them
+    if db.bet_buffer:
+        await db.bet_buffer.close()
+    await db.pool_counter.close()
+
+async def run_webhook(router=None):
+    server = WebhookServer(
+        dp, bot,
+        path=os.getenv("WEBHOOK_PATH", "/webhook"),
+        secret=os.getenv("WEBHOOK_SECRET"),
+        max_concurrency=int(os.getenv("WEBHOOK_MAX_CONCURRENCY", 100)),
+        router=router
+    )
+    if not router:
+        await dp.emit_startup(bot=bot)
+    try:
+        await server.start(
+            os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+            int(os.getenv("WEBHOOK_PORT", 8080)),
+            public_url=os.getenv("WEBHOOK_URL")
+        )
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        if not router:
+            await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+
+async def run_sharded():
+    supervisor = Supervisor(BOT_WORKERS)
+    supervisor.start()
+    await start_metrics()
+    monitor = asyncio.create_task(supervisor.monitor())
+    try:
+        if os.getenv("BOT_MODE", "polling") == "webhook":
+            await run_webhook(router=supervisor.route)
+        else:
+            await supervisor.poll(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        monitor.cancel()
+        supervisor.stop()
+
 async def main():
     # Configure logging
     logging.basicConfig(level=logging.INFO)
-    
-    # Start bot
-    await dp.start_polling(bot)
 
-if __name__ == '__main__':
-    asyncio.run(main())
+    if BOT_WORKERS > 1:
+        await run_sharded()
+        return
+
+    await start_metrics()
+    await on_startup()
 
+    if os.getenv("BOT_MODE", "polling") == "webhook":
+        await run_webhook()
+    else:
+        await dp.start_polling(bot)
 
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,230 @@
+import threading
+import time
+from bisect import bisect_left
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from pymongo import monitoring
+
+# Seconds; covers a cached read up to a slow Telegram call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def counts(self):
+        with self._lock:
+            return {labels: sum(counts) for labels, (counts, _) in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = _labels(self.label_names, labels, [("le", _number(bound))])
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                suffix = _labels(self.label_names, labels)
+                lines.append(f"{self.name}_sum{suffix} {total!r}")
+                lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labels=()):
+        metric = Counter(name, documentation, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+HANDLER_SECONDS = REGISTRY.histogram(
+    "bot_handler_seconds", "Time spent in dispatcher handlers.", ["handler"]
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors_total", "Exceptions raised out of dispatcher handlers.", ["handler", "error"]
+)
+MONGO_SECONDS = REGISTRY.histogram(
+    "mongo_command_seconds", "MongoDB command round-trip time.", ["collection", "command"]
+)
+MONGO_ERRORS = REGISTRY.counter(
+    "mongo_command_errors_total", "Failed MongoDB commands.", ["collection", "command"]
+)
+TELEGRAM_SECONDS = REGISTRY.histogram(
+    "telegram_request_seconds", "Telegram Bot API request time.", ["method"]
+)
+TELEGRAM_ERRORS = REGISTRY.counter(
+    "telegram_request_errors_total", "Failed Telegram Bot API requests.", ["method", "error"]
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing each handler under its function name."""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            HANDLER_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware timing every Bot API call by method."""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(name, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - start, name)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times MongoDB commands by collection and command name.
+
+    The driver calls these hooks from its own threads, so the metrics take
+    a lock. The collection is only known when the command starts and is
+    remembered until it finishes.
+    """
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            # getMore carries a cursor id; bulk/admin commands have no collection
+            target = event.command.get("collection", "")
+        self._collections[(event.connection_id, event.request_id)] = target
+
+    def _finish(self, event):
+        return self._collections.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, collection, event.command_name)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, collection, event.command_name)
+        MONGO_ERRORS.inc(collection, event.command_name)
+
+
+def instrument(dp, bot):
+    middleware = HandlerMetricsMiddleware()
+    dp.message.middleware(middleware)
+    dp.callback_query.middleware(middleware)
+    bot.session.middleware(TelegramMetricsMiddleware())
+
+
+class MetricsServer:
+    """Serves ``/metrics`` for Prometheus to scrape."""
+
+    def __init__(self, registry=REGISTRY, path="/metrics"):
+        self.registry = registry
+        self.path = path
+        self._runner = None
+
+    async def handle(self, request):
+        return web.Response(text=self.registry.render(), content_type="text/plain")
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_get(self.path, self.handle)
+        return app
+
+    async def start(self, host, port):
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
@@ -0,0 +1,92 @@
+from collections import Counter
+from aiogram import BaseMiddleware
+from broadcast import TokenBucket
+from cache import TTLCache
+from callbacks import decode, KIND_NAMES
+
+
+class DisplayNameMiddleware(BaseMiddleware):
+    """Records the sender's display name for every incoming update."""
+
+    def __init__(self, names):
+        self.names = names
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user and not user.is_bot:
+            try:
+                await self.names.remember(user)
+            except Exception as e:
+                print(f"Error storing display name for {user.id}: {e}")
+        return await handler(event, data)
+
+
+# Default (tokens per second, burst) per callback handler class
+THROTTLE_LIMITS = {
+    "bet": (0.5, 3),
+    "resolve": (0.5, 2),
+    "predict": (1, 3),
+    "page": (2, 5),
+    "tz": (0.5, 3),
+    "default": (2, 5),
+}
+
+
+def parse_limits(value):
+    """Parse overrides like ``"bet=0.5/3,resolve=0.2/2"``."""
+    limits = dict(THROTTLE_LIMITS)
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        name, spec = item.split("=")
+        rate, burst = spec.split("/")
+        limits[name.strip()] = (float(rate), int(burst))
+    return limits
+
+
+def callback_class(data):
+    cb = decode(data)
+    if cb is not None:
+        return KIND_NAMES[cb.kind]
+    if data == "predict":
+        return "predict"
+    return "default"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Rejects button mashing before it reaches a handler or the database.
+
+    Every user has a token bucket per callback class. An identical callback
+    repeated within ``debounce`` seconds is dropped as a duplicate.
+    Rejections are a single ``callback_query.answer`` and are counted in
+    ``throttled``.
+    """
+
+    def __init__(self, limits=None, debounce=1.0, maxsize=100000):
+        self.limits = limits or THROTTLE_LIMITS
+        self.buckets = TTLCache(maxsize=maxsize, ttl=600)
+        self.recent = TTLCache(maxsize=maxsize, ttl=debounce)
+        self.throttled = Counter()
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None or event.data is None:
+            return await handler(event, data)
+
+        duplicate_key = (user.id, event.data)
+        if self.recent.get(duplicate_key):
+            self.throttled["duplicate"] += 1
+            await event.answer()
+            return None
+        self.recent.set(duplicate_key, True)
+
+        name = callback_class(event.data)
+        bucket_key = (user.id, name)
+        bucket = self.buckets.get(bucket_key)
+        if bucket is None:
+            rate, burst = self.limits.get(name, self.limits["default"])
+            bucket = TokenBucket(rate, capacity=burst)
+            self.buckets.set(bucket_key, bucket)
+        if not bucket.try_acquire():
+            self.throttled[name] += 1
+            await event.answer("Too many requests, please slow down.")
+            return None
+        return await handler(event, data)
@@ -0,0 +1,37 @@
+"""Move bets embedded in ``predictions.bets`` into the ``bets`` collection.
+
+The bot runs this at startup (``Database.migrate_bets``); this script runs
+it by hand, for example before the first deploy with the bets collection:
+
+    python migrate_bets.py [--batch-size 1000]
+
+Safe to re-run: bets already copied are skipped by the unique
+(prediction_id, user_id) index, and a prediction's embedded array is only
+removed after all of its bets are stored. Per-option pools of migrated
+open predictions are filled in by the bot's pool reconciliation.
+"""
+import argparse
+import asyncio
+import os
+from dotenv import load_dotenv
+from db import Database
+
+
+async def migrate(db, batch_size):
+    await db.ensure_indexes()
+    moved = await db.migrate_bets(batch_size)
+    print(f"Done: migrated {moved} bets")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = Database(os.getenv("MONGO_URI"), os.getenv("DB_NAME"))
+    asyncio.run(migrate(db, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
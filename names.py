@@ -0,0 +1,61 @@
+import asyncio
+from aiogram.exceptions import TelegramBadRequest
+from cache import TTLCache
+
+
+def display_name(user):
+    return user.username or user.first_name
+
+
+class DisplayNames:
+    """Telegram display names cached in memory and on the user document.
+
+    Names are learned from ``from_user`` on every update, so rendering a
+    leaderboard normally needs no Telegram calls at all.
+    """
+
+    def __init__(self, db, bot, maxsize=10000, ttl=3600):
+        self.db = db
+        self.bot = bot
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def remember(self, user):
+        name = display_name(user)
+        if not name or self.cache.get(user.id) == name:
+            return
+        self.cache.set(user.id, name)
+        await self.db.set_display_name(user.id, name)
+
+    async def resolve(self, user_ids):
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self.cache.get(user_id)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+
+        if missing:
+            stored = await self.db.get_display_names(missing)
+            for user_id, name in stored.items():
+                self.cache.set(user_id, name)
+            names.update(stored)
+            missing = [user_id for user_id in missing if user_id not in stored]
+
+        if missing:
+            # Last resort: ask Telegram, concurrently rather than one by one
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            for user_id, name in zip(missing, fetched):
+                if name:
+                    self.cache.set(user_id, name)
+                    await self.db.set_display_name(user_id, name)
+                    names[user_id] = name
+        return names
+
+    async def _fetch(self, user_id):
+        try:
+            chat = await self.bot.get_chat(user_id)
+        except TelegramBadRequest:
+            return None
+        return chat.username or chat.first_name
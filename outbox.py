@@ -0,0 +1,132 @@
+import asyncio
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY = 11000
+
+
+class Outbox:
+    """Mongo-backed queue of outgoing Telegram messages.
+
+    Producers enqueue messages in bulk, and background workers claim them in
+    batches, send them through the ``Broadcaster`` and record the outcome.
+    Claims are leased, so a batch held by a crashed process is picked up
+    again once ``lease`` seconds have passed.
+    """
+
+    def __init__(self, db, broadcaster, batch_size=100, lease=60, poll_interval=1.0):
+        self.messages = db.db["outbox"]
+        self.broadcaster = broadcaster
+        self.batch_size = batch_size
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._drained = deque(maxlen=10000)
+        self._workers = []
+
+    async def ensure_indexes(self):
+        await self.messages.create_index([("status", ASCENDING), ("claimed_at", ASCENDING)])
+        # Finished messages are kept for a day for inspection
+        await self.messages.create_index("finished_at", expireAfterSeconds=86400)
+
+    async def enqueue(self, messages, key_prefix=None):
+        """Queue ``(chat_id, text)`` pairs.
+
+        With ``key_prefix`` each message gets the id ``"<prefix>:<chat_id>"``,
+        so enqueueing the same notification twice is a no-op.
+        """
+        now = datetime.utcnow()
+        docs = []
+        for chat_id, text in messages:
+            doc = {"chat_id": chat_id, "text": text, "status": "pending",
+                   "attempts": 0, "created_at": now}
+            if key_prefix:
+                doc["_id"] = f"{key_prefix}:{chat_id}"
+            docs.append(doc)
+        for i in range(0, len(docs), 1000):
+            try:
+                await self.messages.insert_many(docs[i:i + 1000], ordered=False)
+            except BulkWriteError as e:
+                if any(err["code"] != DUPLICATE_KEY for err in e.details["writeErrors"]):
+                    raise
+        self._wakeup.set()
+        return len(docs)
+
+    async def claim(self):
+        token = uuid.uuid4().hex
+        now = datetime.utcnow()
+        claimable = {"$or": [
+            {"status": "pending"},
+            {"status": "sending", "claimed_at": {"$lt": now - timedelta(seconds=self.lease)}}
+        ]}
+        ids = [doc["_id"] async for doc in self.messages.find(claimable, {"_id": 1}).limit(self.batch_size)]
+        if not ids:
+            return []
+        await self.messages.update_many(
+            {"_id": {"$in": ids}, **claimable},
+            {"$set": {"status": "sending", "claimed_at": now, "claimed_by": token},
+             "$inc": {"attempts": 1}}
+        )
+        return await self.messages.find({"claimed_by": token, "status": "sending"}).to_list(length=None)
+
+    async def process_batch(self):
+        batch = await self.claim()
+        if not batch:
+            return 0
+        outcomes = await asyncio.gather(*(
+            self.broadcaster.deliver(message["chat_id"], message["text"])
+            for message in batch
+        ))
+        by_outcome = {}
+        for message, outcome in zip(batch, outcomes):
+            by_outcome.setdefault(outcome, []).append(message["_id"])
+        finished_at = datetime.utcnow()
+        for outcome, ids in by_outcome.items():
+            await self.messages.update_many(
+                {"_id": {"$in": ids}},
+                {"$set": {"status": outcome, "finished_at": finished_at}}
+            )
+        now = time.monotonic()
+        self._drained.extend(now for _ in batch)
+        return len(batch)
+
+    async def _worker(self):
+        while True:
+            try:
+                if await self.process_batch():
+                    continue
+            except Exception as e:
+                print(f"Error draining outbox: {e}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, workers=2):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def drain_rate(self, window=60):
+        """Messages finished per second over the last ``window`` seconds."""
+        cutoff = time.monotonic() - window
+        return sum(1 for t in self._drained if t >= cutoff) / window
+
+    async def stats(self):
+        counts = {doc["_id"]: doc["count"] async for doc in self.messages.aggregate([
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ])}
+        return {
+            "depth": counts.get("pending", 0) + counts.get("sending", 0),
+            "by_status": counts,
+            "drain_rate": self.drain_rate()
+        }
@@ -0,0 +1,42 @@
+"""Exact pari-mutuel payout allocation in integer token units."""
+import numpy as np
+
+# Products above this would overflow int64 and fall back to Python integers
+INT64_LIMIT = 2 ** 63
+
+
+def allocate(stakes, outcomes, winning, fee_bps=0):
+    """Split the pool between the bets on outcome ``winning``.
+
+    ``stakes`` and ``outcomes`` are parallel arrays of integer stakes and
+    outcome indexes, so any number of outcomes is supported. ``fee_bps``
+    basis points of the pool go to the house first, rounded down. Each
+    winning bet gets ``stake * distributable // winning_stake``. The few
+    units this floors away go one each to the largest remainders, earlier
+    bets first on ties. Returns ``(payouts, fee)`` with payouts aligned to
+    ``stakes``, and ``payouts.sum() + fee`` always equals the pool. If nobody
+    backed the winning outcome, every stake is refunded and no fee is taken.
+    """
+    stakes = np.asarray(stakes, dtype=np.int64)
+    winners = np.asarray(outcomes) == winning
+    pool = int(stakes.sum())
+    winning_stakes = stakes[winners]
+    winning_total = int(winning_stakes.sum())
+    if not winning_total:
+        return stakes.copy(), 0
+
+    fee = pool * fee_bps // 10000
+    distributable = pool - fee
+    if int(winning_stakes.max()) * distributable >= INT64_LIMIT:
+        winning_stakes = winning_stakes.astype(object)
+    products = winning_stakes * distributable
+    shares, remainders = products // winning_total, products % winning_total
+
+    leftover = distributable - int(shares.sum())
+    if leftover:
+        # A stable sort keeps earlier bets ahead among equal remainders
+        shares[np.argsort(-remainders, kind="stable")[:leftover]] += 1
+
+    payouts = np.zeros(len(stakes), dtype=shares.dtype)
+    payouts[winners] = shares
+    return payouts, fee
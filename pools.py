@@ -0,0 +1,94 @@
+"""Per-option stake totals kept on each prediction document.
+
+``prediction["pools"]`` maps an option index, as a string, to
+``{"amount": tokens staked, "bettors": count}``, so live odds cost no
+extra query. The counters are bumped with ``$inc``, but not in the write
+that accepts a bet: a bet is limited to two round-trips (debit and insert),
+and a per-bet write would put every bettor back on the hot prediction
+document. ``PoolCounter`` batches the increments per prediction instead, so
+the counters trail the bets by up to ``POOL_FLUSH_INTERVAL`` seconds. Only
+the displayed odds read them; payouts are computed from the bets.
+``Database.reconcile_pools`` checks them against the bets collection at
+startup and every ``POOL_RECONCILE_INTERVAL`` seconds, which also repairs
+increments lost when a process dies before flushing.
+"""
+import asyncio
+from pymongo import UpdateOne
+
+
+def pool_inc(option, amount, bettors=1):
+    return {f"pools.{option}.amount": amount, f"pools.{option}.bettors": bettors}
+
+
+def option_pools(prediction, options):
+    """``[(amount, bettors), ...]`` for option indexes ``0..options-1``."""
+    pools = prediction.get("pools") or {}
+    return [
+        (pools.get(str(option), {}).get("amount", 0), pools.get(str(option), {}).get("bettors", 0))
+        for option in range(options)
+    ]
+
+
+def multiplier(pools, option, fee_bps=0):
+    """Tokens paid back per token staked on ``option`` if it wins, stake included.
+
+    The house fee of ``fee_bps`` basis points is taken off the pool first,
+    as ``payouts.allocate`` does.
+    """
+    staked = pools[option][0]
+    if not staked:
+        return None
+    return sum(amount for amount, _ in pools) * (10000 - fee_bps) / 10000 / staked
+
+
+class PoolCounter:
+    """Accumulates ``bet_count`` and pool increments and writes them in batches.
+
+    Deltas are summed in memory per prediction and flushed every
+    ``interval`` seconds as one ``$inc`` each, in a single unordered
+    ``bulk_write``. A failed flush keeps its deltas for the next one; deltas
+    lost in a crash are repaired by pool reconciliation.
+    """
+
+    def __init__(self, predictions, interval=1.0):
+        self.predictions = predictions
+        self.interval = interval
+        self._deltas = {}
+        self._flush_handle = None
+
+    def add(self, prediction_id, option, amount, bettors=1):
+        self._merge(prediction_id, {"bet_count": bettors, **pool_inc(option, amount, bettors)})
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.interval, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    def _merge(self, prediction_id, delta):
+        pending = self._deltas.setdefault(prediction_id, {})
+        for field, value in delta.items():
+            pending[field] = pending.get(field, 0) + value
+
+    async def flush(self):
+        self._flush_handle = None
+        deltas, self._deltas = self._deltas, {}
+        if not deltas:
+            return
+        try:
+            await self.predictions.bulk_write([
+                UpdateOne({"_id": prediction_id}, {"$inc": delta})
+                for prediction_id, delta in deltas.items()
+            ], ordered=False)
+        except Exception as e:
+            print(f"Error writing pool counters: {e}")
+            for prediction_id, delta in deltas.items():
+                self._merge(prediction_id, delta)
+            if self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(
+                    self.interval, lambda: asyncio.ensure_future(self.flush())
+                )
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await self.flush()
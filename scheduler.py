@@ -0,0 +1,70 @@
+import asyncio
+import heapq
+from datetime import datetime, timezone
+
+
+def _naive_utc(moment):
+    # Mongo hands back naive UTC datetimes; deadlines from to_utc are aware
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+class DeadlineScheduler:
+    """Fires ``on_deadline(prediction_id)`` exactly when a prediction expires.
+
+    Deadlines live in a min-heap and the loop sleeps until the earliest one,
+    so there is no polling and no CPU cost while idle. Adding an earlier
+    deadline wakes the loop to re-arm its timer. Entries are replaced
+    lazily: a popped entry only fires if it is still the current deadline
+    for that prediction.
+    """
+
+    def __init__(self, on_deadline=None):
+        self.on_deadline = on_deadline
+        self._heap = []
+        self._deadlines = {}
+        self._changed = asyncio.Event()
+
+    async def load(self, predictions):
+        async for prediction in predictions:
+            self.add(prediction["_id"], prediction["expiry_time"])
+
+    def add(self, prediction_id, expiry_time):
+        expiry_time = _naive_utc(expiry_time)
+        self._deadlines[prediction_id] = expiry_time
+        heapq.heappush(self._heap, (expiry_time, str(prediction_id), prediction_id))
+        if self._heap[0][2] == prediction_id:
+            self._changed.set()
+
+    def discard(self, prediction_id):
+        self._deadlines.pop(prediction_id, None)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def _pop_due(self, now):
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            expiry_time, _, prediction_id = heapq.heappop(self._heap)
+            if self._deadlines.get(prediction_id) == expiry_time:
+                del self._deadlines[prediction_id]
+                due.append(prediction_id)
+        return due
+
+    async def run(self):
+        while True:
+            for prediction_id in self._pop_due(datetime.utcnow()):
+                try:
+                    await self.on_deadline(prediction_id)
+                except Exception as e:
+                    print(f"Error handling deadline of prediction {prediction_id}: {e}")
+
+            self._changed.clear()
+            timeout = None
+            if self._heap:
+                timeout = max(0.0, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,320 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, ReturnDocument
+from payouts import allocate
+
+CHUNK_SIZE = 1000
+LEASE_SECONDS = 60
+# How long after a settlement finishes its prediction is still swept for late bets
+LATE_BET_WINDOW = 3600
+
+
+def compute_payouts(bets, result, option=None, fee_bps=0):
+    """Whole-token payouts per winning user, the house fee and whether stakes were refunded.
+
+    Winners share the pool, less the fee, pro rata to their stakes (see
+    ``payouts.allocate``). Bets are matched on the winning option index.
+    Settlements recorded before option indexes existed match on the choice
+    text instead.
+    """
+    if option is None:
+        outcomes, winning = [bet["choice"] == result for bet in bets], True
+    else:
+        # Migrated bets whose choice matched none of the options never win
+        outcomes = [-1 if bet.get("option") is None else bet["option"] for bet in bets]
+        winning = option
+    amounts, fee = allocate([bet["amount"] for bet in bets], outcomes, winning, fee_bps)
+    refunded = bool(bets) and not any(outcome == winning for outcome in outcomes)
+    payouts = {
+        bet["user_id"]: amount
+        for bet, outcome, amount in zip(bets, outcomes, amounts.tolist())
+        if refunded or outcome == winning
+    }
+    return payouts, fee, refunded
+
+
+class SettlementEngine:
+    """Pays out resolved predictions in bulk, exactly once.
+
+    Progress is kept in a ``settlements`` document per prediction. Every
+    balance credit is guarded by the prediction id being absent from the
+    user's ``settlements`` list and adds it in the same atomic update, so
+    re-running a half-finished settlement never pays anyone twice.
+
+    Only one runner pays a prediction at a time: it first claims the record
+    with a lease, renews the lease with every chunk checkpoint, and gives up
+    as soon as a renewal fails. Another process or replica may take over
+    once the lease has expired. The markers are pulled only by the runner
+    that marked the record done while still holding the lease.
+
+    The first runner fixes the set of bets it settles by flagging them
+    ``settled``; resumed runs read exactly that set. Bets placed against a
+    briefly cached prediction can still land after resolution. They stay
+    unflagged and are refunded by ``refund_late_bets``, once right after
+    the settlement and then periodically for ``LATE_BET_WINDOW`` seconds.
+    """
+
+    def __init__(self, db, chunk_size=CHUNK_SIZE, fee_bps=0, lease_seconds=LEASE_SECONDS,
+                 late_bet_window=LATE_BET_WINDOW):
+        self.db = db
+        self.records = db.db["settlements"]
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+        self.late_bet_window = late_bet_window
+        self.fee_bps = fee_bps
+        # Awaited with the report before a settlement is marked done
+        self.on_settled = None
+        self._tasks = set()
+
+    async def begin(self, prediction_id, result, option=None):
+        """Record that a prediction needs settling, so a restart resumes it.
+
+        Returns the record; if one already existed its result stands.
+        """
+        return await self.records.find_one_and_update(
+            {"_id": prediction_id},
+            {"$setOnInsert": {
+                "result": result,
+                "option": option,
+                # Fixed at resolution, so a resume pays with the fee in force back then
+                "fee_bps": self.fee_bps,
+                "status": "running",
+                "chunks_done": 0,
+                "paid": 0,
+                "started_at": datetime.utcnow()
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def settle(self, prediction, result):
+        prediction_id = prediction["_id"]
+        record = await self.begin(prediction_id, result, prediction.get("result_option"))
+        owner = None
+        if record["status"] != "done":
+            owner = uuid.uuid4().hex
+            record = await self._claim(prediction_id, owner)
+            if record is None:
+                print(f"Prediction {prediction_id} is already being settled elsewhere")
+                return None
+            if not record.get("frozen"):
+                # Settling before the startup migration moved them would pay nobody
+                if await self.db.predictions.count_documents(
+                    {"_id": prediction_id, "bets.0": {"$exists": True}}, limit=1
+                ):
+                    raise RuntimeError(f"Prediction {prediction_id} still has embedded bets")
+                await self._freeze(prediction_id, owner)
+                record["frozen"] = True
+        result = record["result"]
+
+        bets = await self.db.get_prediction_bets(prediction_id, settled=bool(record.get("frozen")))
+        payouts, fee, refunded = compute_payouts(
+            bets, result, record.get("option"), record.get("fee_bps", self.fee_bps)
+        )
+        report = self._report(prediction, result, bets, payouts)
+        report["fee"] = fee
+        report["refunded"] = refunded
+        if owner is None:
+            return report
+
+        started = time.perf_counter()
+        items = sorted(payouts.items())
+        chunks = [items[i:i + self.chunk_size] for i in range(0, len(items), self.chunk_size)]
+        for index in range(record["chunks_done"], len(chunks)):
+            await self._pay_chunk(prediction_id, chunks[index])
+            await self._checkpoint(
+                prediction_id, owner,
+                {"$set": {"chunks_done": index + 1}, "$inc": {"paid": len(chunks[index])}}
+            )
+
+        if self.on_settled:
+            await self.on_settled(report)
+
+        await self._checkpoint(
+            prediction_id, owner,
+            {"$set": {"status": "done", "fee": fee, "finished_at": datetime.utcnow()},
+             "$unset": {"owner": "", "lease_until": ""}}
+        )
+        # Nobody else can hold the lease now, and the record says done for good
+        await self.db.users.update_many(
+            {"settlements": prediction_id},
+            {"$pull": {"settlements": prediction_id}}
+        )
+        await self.refund_late_bets([prediction_id])
+
+        elapsed = time.perf_counter() - started
+        report["seconds"] = elapsed
+        report["payouts_per_sec"] = len(items) / elapsed if elapsed else 0
+        print(
+            f"Settled prediction {prediction_id}: {len(items)} payouts "
+            f"in {elapsed:.2f}s ({report['payouts_per_sec']:.0f}/s)"
+        )
+        return report
+
+    def _claimable(self):
+        return {"status": "running", "$or": [
+            {"lease_until": {"$exists": False}},
+            {"lease_until": {"$lte": datetime.utcnow()}}
+        ]}
+
+    async def _claim(self, prediction_id, owner):
+        """Lease a running settlement to ``owner``; None while another runner holds it."""
+        return await self.records.find_one_and_update(
+            {"_id": prediction_id, **self._claimable()},
+            {"$set": {
+                "owner": owner,
+                "lease_until": datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _checkpoint(self, prediction_id, owner, update):
+        """Apply ``update`` and renew the lease, or fail if the lease was lost."""
+        update.setdefault("$set", {})
+        if "status" not in update["$set"]:
+            update["$set"]["lease_until"] = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        result = await self.records.update_one(
+            {"_id": prediction_id, "status": "running", "owner": owner}, update
+        )
+        if not result.matched_count:
+            raise RuntimeError(f"Lost the settlement lease on prediction {prediction_id}")
+
+    def settle_in_background(self, prediction, result):
+        task = asyncio.create_task(self._settle_logged(prediction, result))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def drain(self):
+        """Wait for every settlement started with ``settle_in_background``."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def _settle_logged(self, prediction, result):
+        try:
+            return await self.settle(prediction, result)
+        except Exception as e:
+            # The record stays "running" and is resumed on the next start
+            print(f"Error settling prediction {prediction['_id']}: {e}")
+
+    async def _freeze(self, prediction_id, owner):
+        """Flag the bets this settlement covers; any bet landing later is refunded."""
+        await self.db.bets.update_many(
+            {"prediction_id": prediction_id}, {"$set": {"settled": True}}
+        )
+        await self._checkpoint(prediction_id, owner, {"$set": {"frozen": True}})
+
+    async def refund_late_bets(self, prediction_ids):
+        """Refund and delete bets on settled predictions that missed the freeze.
+
+        Only call this for settlements that are done. Each credit is guarded
+        by the bet id in the user's ``refunds`` list, which is kept, so a
+        retried or concurrent sweep refunds a bet once.
+        """
+        late = await self.db.bets.find(
+            {"prediction_id": {"$in": prediction_ids}, "settled": {"$ne": True}},
+            {"user_id": 1, "amount": 1}
+        ).to_list(length=None)
+        if not late:
+            return 0
+        await self.db.users.bulk_write([
+            UpdateOne(
+                {"user_id": bet["user_id"], "refunds": {"$ne": bet["_id"]}},
+                {"$inc": {"balance": bet["amount"]}, "$push": {"refunds": bet["_id"]}}
+            )
+            for bet in late
+        ], ordered=False)
+        await self.db.bets.delete_many({"_id": {"$in": [bet["_id"] for bet in late]}})
+        self.db._invalidate_user(*(bet["user_id"] for bet in late))
+        print(f"Refunded {len(late)} bets placed after their prediction was settled")
+        return len(late)
+
+    async def sweep_late_bets(self):
+        since = datetime.utcnow() - timedelta(seconds=self.late_bet_window)
+        prediction_ids = await self.records.distinct(
+            "_id", {"status": "done", "finished_at": {"$gt": since}, "frozen": True}
+        )
+        if prediction_ids:
+            await self.refund_late_bets(prediction_ids)
+
+    async def _pay_chunk(self, prediction_id, chunk):
+        requests = [
+            UpdateOne(
+                {"user_id": user_id, "settlements": {"$ne": prediction_id}},
+                {"$inc": {"balance": amount}, "$push": {"settlements": prediction_id}}
+            )
+            for user_id, amount in chunk
+        ]
+        await self.db.users.bulk_write(requests, ordered=False)
+        self.db._invalidate_user(*(user_id for user_id, _ in chunk))
+
+    async def resume_pending(self):
+        """Finish settlements interrupted by a crash or restart.
+
+        Settlements another runner is still leasing are left to it.
+        """
+        reports = []
+        async for record in self.records.find(self._claimable()):
+            prediction = await self.db.predictions.find_one(
+                {"_id": record["_id"]}, {"bets": 0}
+            )
+            if prediction and not prediction["resolved"]:
+                # Give a resolver that is still running time to flip the prediction itself
+                if record["started_at"] > datetime.utcnow() - timedelta(seconds=self.lease_seconds):
+                    continue
+                # The resolver stopped between writing this record and resolving
+                prediction = await self.db.mark_resolved(record)
+            if prediction:
+                report = await self.settle(prediction, record["result"])
+                if report is not None:
+                    reports.append(report)
+        return reports
+
+    async def run(self, interval=None):
+        """Keep resuming stalled settlements and refunding late bets."""
+        interval = interval or self.lease_seconds
+        while True:
+            try:
+                await self.resume_pending()
+                await self.sweep_late_bets()
+            except Exception as e:
+                print(f"Error resuming settlements: {e}")
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def _report(prediction, result, bets, payouts):
+        report = {
+            "prediction_id": prediction["_id"],
+            "question": prediction.get("question"),
+            "winning_choice": result,
+            "user_ids": [],
+            "winners": [],
+            "losers": [],
+            "top_winner": None,
+            "top_amount": 0,
+            "fee": 0,
+            "refunded": False,
+            "seconds": 0,
+            "payouts_per_sec": 0
+        }
+        for bet in bets:
+            report["user_ids"].append(bet["user_id"])
+            reward = payouts.get(bet["user_id"])
+            if reward is not None:
+                report["winners"].append({
+                    "user_id": bet["user_id"],
+                    "bet_amount": bet["amount"],
+                    "reward": reward
+                })
+                if reward > report["top_amount"]:
+                    report["top_winner"] = bet["user_id"]
+                    report["top_amount"] = reward
+            else:
+                report["losers"].append({
+                    "user_id": bet["user_id"],
+                    "bet_amount": bet["amount"],
+                    "lost_amount": bet["amount"]
+                })
+        return report
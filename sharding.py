@@ -0,0 +1,173 @@
+import asyncio
+import multiprocessing
+import queue as queue_module
+import sys
+import time
+
+from aiogram.types import Update
+
+
+def update_user_id(update):
+    event = update.event
+    user = getattr(event, "from_user", None)
+    return user.id if user else None
+
+
+def shard_for(update, workers):
+    user_id = update_user_id(update)
+    return (user_id if user_id is not None else update.update_id) % workers
+
+
+async def consume(updates, handle, concurrency=100):
+    """Feed ``(user_key, payload)`` items from a process queue to ``handle``.
+
+    Each user gets a lane that processes their updates strictly in order.
+    Different users run concurrently, up to ``concurrency`` at a time.
+    Returns once the ``None`` sentinel is received and every lane has drained.
+    """
+    loop = asyncio.get_running_loop()
+    lanes = {}
+    tasks = set()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_lane(key, lane):
+        while True:
+            try:
+                payload = lane.get_nowait()
+            except asyncio.QueueEmpty:
+                del lanes[key]
+                return
+            async with semaphore:
+                try:
+                    await handle(payload)
+                except Exception as e:
+                    print(f"Error processing update for {key}: {e}")
+
+    running = True
+    while running:
+        items = [await loop.run_in_executor(None, updates.get)]
+        # Pick up whatever else is already waiting without another thread hop
+        while len(items) < 1000:
+            try:
+                items.append(updates.get_nowait())
+            except queue_module.Empty:
+                break
+        for item in items:
+            if item is None:
+                running = False
+                break
+            key, payload = item
+            lane = lanes.get(key)
+            if lane is None:
+                lane = lanes[key] = asyncio.Queue()
+                task = asyncio.create_task(run_lane(key, lane))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            lane.put_nowait(payload)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+def _bot_module():
+    # Under "spawn" a child started from ``python main.py`` has already run
+    # main.py as __mp_main__; reuse it instead of building a second bot.
+    module = sys.modules.get("__mp_main__")
+    if module is not None and hasattr(module, "dp"):
+        return module
+    import main
+    return main
+
+
+def bot_worker(index, updates):
+    """Worker process entry point: run the bot's dispatcher on one shard."""
+    main = _bot_module()
+
+    async def run():
+        await main.start_metrics(offset=index + 1)
+        await main.on_startup(primary=index == 0)
+        await main.dp.emit_startup(bot=main.bot)
+
+        async def handle(payload):
+            update = Update.model_validate_json(payload, context={"bot": main.bot})
+            await main.dp.feed_update(main.bot, update)
+
+        try:
+            await consume(updates, handle, concurrency=main.WORKER_CONCURRENCY)
+        finally:
+            await main.dp.emit_shutdown(bot=main.bot)
+            await main.bot.session.close()
+
+    asyncio.run(run())
+
+
+class Supervisor:
+    """Routes updates onto worker processes by user and keeps them alive.
+
+    Updates are hashed by ``from_user.id`` so one user's updates always land
+    on the same worker, which processes them in order. A dead worker is
+    restarted on the same queue, so it picks up the updates still waiting.
+    """
+
+    def __init__(self, workers, target=bot_worker, args=()):
+        self.workers = workers
+        self.target = target
+        self.args = args
+        self.context = multiprocessing.get_context("spawn")
+        self.queues = [self.context.Queue() for _ in range(workers)]
+        self.processes = [None] * workers
+        self.restarts = 0
+        self._stopping = False
+
+    def _spawn(self, index):
+        process = self.context.Process(
+            target=self.target,
+            args=(index, self.queues[index], *self.args),
+            name=f"bot-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def route(self, update):
+        index = shard_for(update, self.workers)
+        key = update_user_id(update) or update.update_id
+        self.queues[index].put((key, update.model_dump_json(exclude_unset=True)))
+
+    async def monitor(self, interval=1.0):
+        while not self._stopping:
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    print(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    self.restarts += 1
+                    self._spawn(index)
+            await asyncio.sleep(interval)
+
+    async def poll(self, bot, allowed_updates=None, timeout=30):
+        """Long-poll Telegram and route every update to its worker."""
+        offset = None
+        while not self._stopping:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=timeout, allowed_updates=allowed_updates
+                )
+            except Exception as e:
+                print(f"Error fetching updates: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                self.route(update)
+                offset = update.update_id + 1
+
+    def stop(self, timeout=10):
+        self._stopping = True
+        for updates in self.queues:
+            updates.put(None)
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime
+from aiogram import BaseMiddleware
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from pymongo import UpdateOne, DeleteOne
+from cache import TTLCache
+
+
+class MongoFSMStorage(BaseStorage):
+    """aiogram FSM storage on the bot's Motor database.
+
+    Each key is one document holding both state and data, so a single read
+    answers ``get_state`` and ``get_data``. Reads go through an in-process
+    cache and writes are buffered, so the several reads and writes a handler
+    usually makes cost one read and one bulk round-trip. The next update for
+    the same chat may be handled by another process or replica, so
+    ``FSMReleaseMiddleware`` flushes the writes and drops the cached record
+    before an update is finished; ``cache_ttl`` and ``write_delay`` only
+    bound anything touched outside an update. Abandoned conversations expire
+    after ``ttl`` seconds through a TTL index.
+    """
+
+    def __init__(self, collection, ttl=86400, cache_ttl=2, cache_size=10000, write_delay=0.05):
+        self.collection = collection
+        self.ttl = ttl
+        self.write_delay = write_delay
+        self.key_builder = DefaultKeyBuilder()
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._dirty = {}
+        self._flush_handle = None
+        self._flush_lock = asyncio.Lock()
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("updated_at", expireAfterSeconds=self.ttl)
+
+    async def _load(self, key):
+        document_id = self.key_builder.build(key)
+        record = self._dirty.get(document_id) or self.cache.get(document_id)
+        if record is None:
+            document = await self.collection.find_one({"_id": document_id}) or {}
+            record = {"state": document.get("state"), "data": document.get("data") or {}}
+            self.cache.set(document_id, record)
+        return document_id, record
+
+    async def get_state(self, key):
+        _, record = await self._load(key)
+        return record["state"]
+
+    async def get_data(self, key):
+        _, record = await self._load(key)
+        return dict(record["data"])
+
+    async def set_state(self, key, state=None):
+        document_id, record = await self._load(key)
+        if isinstance(state, State):
+            state = state.state
+        elif state is not None:
+            state = str(state)
+        self._write(document_id, {"state": state, "data": record["data"]})
+
+    async def set_data(self, key, data):
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        document_id, record = await self._load(key)
+        self._write(document_id, {"state": record["state"], "data": dict(data)})
+
+    def _write(self, document_id, record):
+        self.cache.set(document_id, record)
+        self._dirty[document_id] = record
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(
+                self.write_delay, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    async def flush(self):
+        self._flush_handle = None
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return
+            now = datetime.utcnow()
+            requests = []
+            for document_id, record in dirty.items():
+                if record["state"] is None and not record["data"]:
+                    requests.append(DeleteOne({"_id": document_id}))
+                else:
+                    requests.append(UpdateOne(
+                        {"_id": document_id},
+                        {"$set": {**record, "updated_at": now}},
+                        upsert=True
+                    ))
+            try:
+                await self.collection.bulk_write(requests, ordered=False)
+            except Exception as e:
+                # Keep the records so the next flush retries them
+                for document_id, record in dirty.items():
+                    self._dirty.setdefault(document_id, record)
+                print(f"Error flushing FSM storage: {e}")
+                self._schedule_flush()
+
+    async def release(self, key):
+        """Write pending changes and forget the cached record for ``key``."""
+        await self.flush()
+        self.cache.pop(self.key_builder.build(key))
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        await self.flush()
+
+
+class FSMReleaseMiddleware(BaseMiddleware):
+    """Releases the update's FSM record once its handlers are done.
+
+    Register on ``dp.update`` as an outer middleware, after the dispatcher's
+    own FSM middleware has put the ``state`` context in place.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    async def __call__(self, handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            state = data.get("state")
+            if state is not None:
+                await self.storage.release(state.key)
@@ -0,0 +1,77 @@
+import asyncio
+import hmac
+from aiohttp import web
+from aiogram.types import Update
+from pydantic import ValidationError
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Receives updates over HTTP and feeds them to the dispatcher.
+
+    Requests are acknowledged as soon as the update is accepted, and
+    processing continues in the background. At most ``max_concurrency``
+    updates are processed at once. Beyond that, new requests wait before
+    being acknowledged, which pushes back on Telegram instead of piling up
+    tasks.
+    """
+
+    def __init__(self, dp, bot, path="/webhook", secret=None, max_concurrency=100, router=None):
+        self.dp = dp
+        # In sharded mode updates are handed to worker processes instead
+        self.router = router
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks = set()
+        self._runner = None
+
+    async def handle(self, request):
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+
+        if self.router:
+            self.router(update)
+            return web.Response()
+
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            print(f"Error processing update {update.update_id}: {e}")
+        finally:
+            self.semaphore.release()
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def start(self, host, port, public_url=None):
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        if public_url:
+            await self.bot.set_webhook(
+                public_url.rstrip("/") + self.path,
+                secret_token=self.secret,
+                allowed_updates=self.dp.resolve_used_update_types()
+            )
+
+    async def stop(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._runner:
+            await self._runner.cleanup()